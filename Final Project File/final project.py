@@ -1,6 +1,8 @@
 import numpy as np
 from enum import Enum
 
+from marketlib.market_core import Layout, StallType
+
 class CellType(Enum):
     EMPTY = 0
     STALL = 1
@@ -13,6 +15,10 @@ class Grid:
         self.height = height
         self.cells = np.full((height, width), CellType.EMPTY)
         self.stall_map = np.full((height, width), -1, dtype=int)  # store stall type index when a stall is placed
+        self.stall_ids = np.full((height, width), -1, dtype=int)  # store stall instance id when a stall is placed
+        # Layout columns type_id, x, y, w, h of every placed stall (column i = stall id i)
+        self.placed = np.zeros((5, width * height), dtype=np.int32)
+        self.n_stalls = 0
 
     def in_bounds(self, x, y):
         return 0 <= x < self.width and 0 <= y < self.height
@@ -23,16 +29,10 @@ class Grid:
                 (1,-1),  (1,0),  (1,1)]
         return [(x+dx, y+dy) for dx, dy in dirs
                 if self.in_bounds(x+dx, y+dy)]
-    
-class StallType:
-    def __init__(self, name, odor, wetness, affinity, sizes=None):
-        self.name = name
-        self.odor = odor
-        self.wetness = wetness
-        self.affinity = affinity  # long-term vs short-term
-        # sizes: list of (w,h) options for the stall footprint in grid cells
-        # if None, default to single-cell
-        self.sizes = sizes or [(1, 1)]
+
+    def layout(self, stall_types):
+        """Placed stalls as a struct-of-arrays Layout (row i = stall id i)."""
+        return Layout(stall_types, *self.placed[:, :self.n_stalls])
 
 FRESH = StallType("Fresh", odor=3, wetness=3, affinity="long", sizes=[(2,2),(2,3),(3,2)])
 PRODUCE = StallType("Produce", odor=1, wetness=1, affinity="both", sizes=[(1,1),(1,2),(2,1)])
@@ -59,50 +59,73 @@ from matplotlib import cm
 import datetime
 import uuid
 
+from marketlib.async_writer import AsyncWriter
+from marketlib.crowd_flow import build_flow_fields, simulate
+
 # Use the StallType instances defined above
 STALL_TYPES = [FRESH, PRODUCE, COOKED, GENERAL]
 
-def ca_step(grid, efficiency, exploration):
+def fitness_field(stall, efficiency, exploration):
+    """Fitness of placing `stall` at every cell: efficiency for long-term, exploration for short-term stalls."""
+    if stall.affinity == "long":
+        return np.asarray(efficiency, dtype=float)
+    if stall.affinity == "short":
+        return np.asarray(exploration, dtype=float)
+    return np.zeros(np.shape(efficiency))
+
+def prepare_ca(grid, efficiency, exploration, stall_types=STALL_TYPES):
+    """Flat lookup tables for the CA loop, built once per run.
+
+    The fields do not change while stalls are placed, so the best-scoring
+    types of every cell are precomputed: codes[y, x] is a bitmask of the tied
+    best types and choices[code] lists them.  free marks the EMPTY cells.
+    """
+    scores = np.stack([fitness_field(st, efficiency, exploration) for st in stall_types])
+    best = scores == scores.max(axis=0)
+    codes = (best * (1 << np.arange(len(stall_types)))[:, None, None]).sum(axis=0)
+    return {
+        'codes': codes.tolist(),
+        'choices': [[t for t in range(len(stall_types)) if code >> t & 1] for code in range(1 << len(stall_types))],
+        'sizes': [list(st.sizes) for st in stall_types],
+        'free': grid.cells == CellType.EMPTY,
+    }
+
+def ca_step(grid, ca):
+    """Try to place one stall at a random cell; return the number of cells filled."""
     x = random.randint(0, grid.width - 1)
     y = random.randint(0, grid.height - 1)
-    if grid.cells[y, x] != CellType.EMPTY:
-        return
+    free = ca['free']
+    if not free[y, x]:
+        return 0
 
-    # compute fitness scores for each stall type
-    scores = [fitness_score(x, y, stall, efficiency, exploration) for stall in STALL_TYPES]
-    max_score = max(scores)
     # pick randomly among tied best scores to avoid bias toward first entry
-    best_indices = [i for i, s in enumerate(scores) if s == max_score]
-    best_idx = random.choice(best_indices)
+    best_idx = random.choice(ca['choices'][ca['codes'][y][x]])
 
     # choose size option for this stall type
-    w, h = random.choice(STALL_TYPES[best_idx].sizes)
+    w, h = random.choice(ca['sizes'][best_idx])
 
     # check bounds and occupancy for footprint (x..x+w-1, y..y+h-1)
     if x + w > grid.width or y + h > grid.height:
-        return
-    region = grid.cells[y:y+h, x:x+w]
-    if np.any(region != CellType.EMPTY):
-        return
+        return 0
+    if not free[y:y+h, x:x+w].all():
+        return 0
 
-    # place the stall: mark all cells in footprint
+    # place the stall: mark all cells in footprint and record its layout column
+    free[y:y+h, x:x+w] = False
     grid.cells[y:y+h, x:x+w] = CellType.STALL
     grid.stall_map[y:y+h, x:x+w] = best_idx
+    grid.stall_ids[y:y+h, x:x+w] = grid.n_stalls
+    grid.placed[:, grid.n_stalls] = best_idx, x, y, w, h
+    grid.n_stalls += 1
+    return w * h
 
-def fitness_score(x, y, stall, efficiency, exploration):
-    score = 0.0
-    if stall.affinity == "long":
-        score += efficiency[y, x]
-    elif stall.affinity == "short":
-        score += exploration[y, x]
-    return score
+def build_site(width=40, height=25, aisle_spacing=6, aisle_offset=3):
+    """Create a grid with aisles and utilities marked.
 
-if __name__ == "__main__":
-    print("Script started")
-    grid = Grid(40, 25)
-
-    eff = efficiency_field(grid)
-    exp = exploration_field(grid)
+    Returns (grid, site) where site holds the primary/secondary path cells,
+    drain/electric points and shopper entrances as lists of (x, y).
+    """
+    grid = Grid(width, height)
 
     # --- Define primary/secondary paths and utilities (drains/electric) ---
     primary_paths = []
@@ -113,14 +136,16 @@ if __name__ == "__main__":
         primary_paths.append((x, center_row))
         primary_paths.append((x, 0))
         primary_paths.append((x, grid.height - 1))
-    # secondary: vertical aisles every 6 columns
-    for x in range(3, grid.width, 6):
+    # secondary: vertical aisles every `aisle_spacing` columns
+    for x in range(aisle_offset, grid.width, aisle_spacing):
         for y in range(grid.height):
             secondary_paths.append((x, y))
 
     # utilities
-    drain_points = [(10, 0), (30, 0)]
+    drain_points = [(grid.width // 4, 0), (grid.width * 3 // 4, 0)]
     electric_points = [(0, center_row), (grid.width - 1, center_row)]
+    # shoppers enter/leave at both ends of the central aisle
+    entrances = [(0, center_row), (grid.width - 1, center_row)]
 
     # mark aisles on grid
     for (x, y) in primary_paths + secondary_paths:
@@ -132,19 +157,40 @@ if __name__ == "__main__":
         if grid.in_bounds(x, y):
             grid.cells[y, x] = CellType.AISLE
 
-    # Run CA steps until target density reached or max attempts exceeded
-    total_cells = grid.width * grid.height
-    target_density = 0.35  # desired fraction of cells to fill with stalls (adjustable)
-    target_cells = int(total_cells * target_density)
+    site = {
+        'primary_paths': primary_paths,
+        'secondary_paths': secondary_paths,
+        'drain_points': drain_points,
+        'electric_points': electric_points,
+        'entrances': entrances,
+    }
+    return grid, site
+
+def run_ca(grid, efficiency, exploration, target_density=0.35, max_attempts=5000):
+    """Run CA steps until target density reached or max attempts exceeded; return cells filled."""
+    target_cells = int(grid.width * grid.height * target_density)
     placed_cells = 0
     attempts = 0
-    max_attempts = 5000
+    ca = prepare_ca(grid, efficiency, exploration)
     while placed_cells < target_cells and attempts < max_attempts:
-        before = int((grid.cells == CellType.STALL).sum())
-        ca_step(grid, eff, exp)
-        after = int((grid.cells == CellType.STALL).sum())
-        placed_cells += max(0, after - before)
+        placed_cells += ca_step(grid, ca)
         attempts += 1
+    return placed_cells
+
+if __name__ == "__main__":
+    print("Script started")
+    grid, site = build_site(40, 25)
+    primary_paths = site['primary_paths']
+    secondary_paths = site['secondary_paths']
+    drain_points = site['drain_points']
+    electric_points = site['electric_points']
+    entrances = site['entrances']
+
+    eff = efficiency_field(grid)
+    exp = exploration_field(grid)
+
+    target_density = 0.35  # desired fraction of cells to fill with stalls (adjustable)
+    run_ca(grid, eff, exp, target_density=target_density)
 
     # report counts
     total_cells = grid.width * grid.height
@@ -157,6 +203,76 @@ if __name__ == "__main__":
         counts[st.name] = int((grid.stall_map == idx).sum())
     print("Stall type counts:", counts)
 
+    color_map = {
+        'Fresh': (1.0, 0.2, 0.2),
+        'Produce': (0.2, 0.8, 0.2),
+        'Cooked': (0.9, 0.6, 0.1),
+        'General': (0.6, 0.6, 0.6),
+    }
+
+    # --- Stall maps: queued on a background writer while the crowd flow is simulated ---
+    writer = AsyncWriter()  # also flushed at exit if the script stops early
+    summary_path = None
+    os.makedirs('outputs', exist_ok=True)
+    # unique timestamp + short uuid to avoid overwriting previous runs
+    ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:6]
+    saved_files = []
+    stall_grid = grid.stall_map.copy()
+
+    # save raw stall grid as CSV for quick inspection
+    csv_path = f'outputs/stall_grid_{ts}.csv'
+    writer.submit(np.savetxt, csv_path, stall_grid, fmt='%d', delimiter=',')
+    saved_files.append(csv_path)
+
+    # 2D RGB visualization by stall category saved via Pillow (avoids matplotlib GUI issues)
+    try:
+        from PIL import Image  # used by writer.write_png on the writer thread
+        height, width = stall_grid.shape
+        # palette row per stall type, last row white for empty cells (index -1)
+        palette = np.array([color_map.get(st.name, (0.5, 0.5, 0.5)) for st in STALL_TYPES]
+                           + [(1.0, 1.0, 1.0)])
+        rgb = palette[stall_grid]
+
+        img_arr = (np.clip(rgb, 0.0, 1.0) * 255).astype('uint8')
+        fname_debug = f'outputs/stall_map_debug_{ts}.png'
+        writer.write_png(fname_debug, img_arr)
+        saved_files.append(fname_debug)
+
+        # overlay primary/secondary/utilities by drawing on a copy
+        overlay = img_arr.copy()
+        # primary paths: black pixels
+        for (px, py) in primary_paths:
+            if 0 <= py < height and 0 <= px < width:
+                overlay[py, px] = (0, 0, 0)
+        # secondary paths: gray
+        for (sx, sy) in secondary_paths:
+            if 0 <= sy < height and 0 <= sx < width:
+                overlay[sy, sx] = (128, 128, 128)
+        # drains: blue
+        for (dx, dy) in drain_points:
+            if 0 <= dy < height and 0 <= dx < width:
+                overlay[dy, dx] = (0, 0, 255)
+        # electric: yellow
+        for (ex, ey) in electric_points:
+            if 0 <= ey < height and 0 <= ex < width:
+                overlay[ey, ex] = (255, 255, 0)
+
+        fname_paths = f'outputs/stall_map_with_paths_{ts}.png'
+        writer.write_png(fname_paths, overlay)
+        saved_files.append(fname_paths)
+    except Exception as e:
+        # Pillow not available or saving failed; the stall grid CSV is still written
+        Image = None
+        print('Pillow not available; saved stall grid CSV only.', e)
+
+    # --- Crowd-flow simulation: footfall per stall and aisle congestion ---
+    layout = grid.layout(STALL_TYPES)
+    walkable = (grid.cells == CellType.AISLE) | (grid.cells == CellType.EMPTY)
+    flow_fields = build_flow_fields(walkable, grid.stall_ids, layout.type_id, entrances)
+    flow = simulate(flow_fields, n_shoppers=5000, duration=600)
+    print(f"Shoppers served: {flow['served']}, unserved: {flow['unserved']}, "
+          f"mean trip time: {flow['mean_trip_time']:.1f} steps")
+
     # --- Visualization: try COMPAS viewer, fallback to matplotlib heatmap ---
     # Skip COMPAS imports to avoid native GUI/library crashes in this environment.
     Viewer = None
@@ -206,13 +322,6 @@ if __name__ == "__main__":
         else:
             return Mesh.from_vertices_and_faces(verts, faces)
 
-    color_map = {
-        'Fresh': (1.0, 0.2, 0.2),
-        'Produce': (0.2, 0.8, 0.2),
-        'Cooked': (0.9, 0.6, 0.1),
-        'General': (0.6, 0.6, 0.6),
-    }
-
     if Viewer is not None:
         viewer = Viewer()
         # add meshes for each placed stall
@@ -282,87 +391,47 @@ if __name__ == "__main__":
         # fallback: continue to matplotlib visualizations below
         pass
 
-    # --- Always also save matplotlib 2D heatmap and 3D bar plot for quick viewing ---
+    # --- Flow results: congestion map, footfall and summary ---
     print("Saving matplotlib images...")
     try:
-        os.makedirs('outputs', exist_ok=True)
-        # unique timestamp + short uuid to avoid overwriting previous runs
-        ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:6]
-        saved_files = []
-        stall_grid = np.full((grid.height, grid.width), -1, dtype=int)
-        for y in range(grid.height):
-            for x in range(grid.width):
-                stall_grid[y, x] = grid.stall_map[y, x]
-
-        # 2D RGB visualization by stall category saved via Pillow (avoids matplotlib GUI issues)
-        try:
-            from PIL import Image
-            height, width = stall_grid.shape
-            rgb = np.ones((height, width, 3), dtype=float)  # default white for empty
-            for y in range(height):
-                for x in range(width):
-                    idx = stall_grid[y, x]
-                    if idx >= 0:
-                        stname = STALL_TYPES[idx].name
-                        rgb[y, x, :] = color_map.get(stname, (0.5, 0.5, 0.5))
-
-            img_arr = (np.clip(rgb, 0.0, 1.0) * 255).astype('uint8')
-            fname_debug = f'outputs/stall_map_debug_{ts}.png'
-            Image.fromarray(img_arr, 'RGB').save(fname_debug)
-            saved_files.append(fname_debug)
-
-            # overlay primary/secondary/utilities by drawing on a copy
-            overlay = img_arr.copy()
-            # primary paths: black pixels
-            for (px, py) in primary_paths:
-                if 0 <= py < height and 0 <= px < width:
-                    overlay[py, px] = (0, 0, 0)
-            # secondary paths: gray
-            for (sx, sy) in secondary_paths:
-                if 0 <= sy < height and 0 <= sx < width:
-                    overlay[sy, sx] = (128, 128, 128)
-            # drains: blue
-            for (dx, dy) in drain_points:
-                if 0 <= dy < height and 0 <= dx < width:
-                    overlay[dy, dx] = (0, 0, 255)
-            # electric: yellow
-            for (ex, ey) in electric_points:
-                if 0 <= ey < height and 0 <= ex < width:
-                    overlay[ey, ex] = (255, 255, 0)
-
-            fname_paths = f'outputs/stall_map_with_paths_{ts}.png'
-            Image.fromarray(overlay, 'RGB').save(fname_paths)
-            saved_files.append(fname_paths)
-
-            # save raw stall grid as CSV for quick inspection
-            csv_path = f'outputs/stall_grid_{ts}.csv'
-            np.savetxt(csv_path, stall_grid, fmt='%d', delimiter=',')
-            saved_files.append(csv_path)
-        except Exception as e:
-            # Pillow not available or saving failed; fall back to writing CSV only
-            try:
-                csv_path = f'outputs/stall_grid_{ts}.csv'
-                np.savetxt(csv_path, stall_grid, fmt='%d', delimiter=',')
-                saved_files.append(csv_path)
-                print('Pillow not available; saved stall grid CSV only.')
-            except Exception as e2:
-                print('Failed to save visualizations via Pillow or CSV:', e, e2)
+        if Image is not None:
+            # congestion heatmap: shopper-steps per cell, stalls left white
+            heat = flow['heatmap']
+            heat_norm = heat / heat.max() if heat.max() > 0 else heat
+            heat_rgb = (matplotlib.colormaps['hot_r'](heat_norm)[..., :3] * 255).astype('uint8')
+            heat_rgb[~walkable] = (255, 255, 255)
+            fname_flow = f'outputs/congestion_{ts}.png'
+            writer.write_png(fname_flow, heat_rgb)
+            saved_files.append(fname_flow)
+
+        # per-stall footfall for ranking / inspection
+        footfall_path = f'outputs/footfall_{ts}.csv'
+        lines = ['stall_id,type,x,y,w,h,footfall,exposure\n']
+        for sid, (name, x, y, w, h) in enumerate(zip(layout.names, layout.x, layout.y, layout.w, layout.h)):
+            lines.append(f"{sid},{name},{x},{y},{w},{h},{flow['footfall'][sid]},{flow['exposure'][sid]:.0f}\n")
+        writer.write_text(footfall_path, ''.join(lines))
+        saved_files.append(footfall_path)
 
         # write run summary (counts + saved filenames)
         summary_path = f'outputs/run_summary_{ts}.txt'
-        try:
-            with open(summary_path, 'w', encoding='utf-8') as f:
-                f.write(f'Script timestamp: {ts}\n')
-                f.write(f'Total cells: {total_cells}, Stalls placed: {stall_count}, Empty: {empty_count}\n')
-                f.write('Stall type counts:\n')
-                for k, v in counts.items():
-                    f.write(f'  {k}: {v}\n')
-                f.write('\nSaved files:\n')
-                for p in saved_files:
-                    f.write(f'  {p}\n')
-            print(f'Saved images and summary to outputs/ (summary: {summary_path})')
-        except Exception as e:
-            print('Failed to write run summary:', e)
+        lines = [f'Script timestamp: {ts}\n',
+                 f'Total cells: {total_cells}, Stalls placed: {stall_count}, Empty: {empty_count}\n',
+                 'Stall type counts:\n']
+        for k, v in counts.items():
+            lines.append(f'  {k}: {v}\n')
+        lines.append(f"Shoppers served: {flow['served']}, unserved: {flow['unserved']}, "
+                     f"mean trip time: {flow['mean_trip_time']:.1f} steps\n")
+        lines.append('\nSaved files:\n')
+        for p in saved_files:
+            lines.append(f'  {p}\n')
+        writer.write_text(summary_path, ''.join(lines))
     except Exception as e:
         print('Failed to save matplotlib visualizations:', e)
+    finally:
+        # wait for every queued export before reporting
+        writer.close()
+        for job, e in writer.errors:
+            print(f'Failed to write {job}:', e)
+        if summary_path and not writer.errors:
+            print(f'Saved images and summary to outputs/ (summary: {summary_path})')
 
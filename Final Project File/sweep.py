@@ -0,0 +1,323 @@
+"""Parallel parameter sweeps over the market layout generators.
+
+Runs are grouped by site geometry (grid size, aisle layout, ...) so the
+expensive shared data for a site -- the aisle grid, the efficiency /
+exploration fields and the entrance distance map -- is built once per group
+and reused by every configuration in it.  Groups (split into chunks when
+there are fewer groups than workers) run on a process pool and all results
+are collected into one pandas table.  With ``--layouts DIR`` every run's
+layout is also saved as a CSV; each worker queues them on its own
+``AsyncWriter`` so the files are written while it computes the next run.
+
+Examples::
+
+    python sweep.py final target_density=0.25,0.35,0.45 aisle_spacing=4,6,8 --repeats 5
+    python sweep.py market02 --random 200 fish_cooked=-100:-10 pair=0:30 --workers 8
+    python sweep.py market01 drain=0.5,1.5,3 odor=1,2,4 maxiter=20 --layouts outputs/layouts
+"""
+import argparse
+import copy
+import datetime
+import importlib.util
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from marketlib.async_writer import AsyncWriter
+from marketlib.crowd_flow import build_flow_fields, dilate, distance_field, simulate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROCESS_DIR = os.path.join(HERE, '..', 'Process File')
+
+
+def _load_script(name, path):
+    """Load a generator script by path (the folders and 'final project.py' are not importable names)."""
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def _final_project():
+    return _load_script('final_project', os.path.join(HERE, 'final project.py'))
+
+
+def _process_module(name):
+    return _load_script(name, os.path.join(PROCESS_DIR, f'{name}.py'))
+
+
+# --- final project.py: CA generator + crowd-flow metrics ---
+
+def _prepare_final(width, height, aisle_spacing, aisle_offset):
+    fp = _final_project()
+    grid, site = fp.build_site(width, height, aisle_spacing, aisle_offset)
+    entrance_mask = np.zeros((height, width), dtype=bool)
+    for x, y in site['entrances']:
+        entrance_mask[y, x] = True
+    return {
+        'fp': fp,
+        'grid': grid,
+        'site': site,
+        'eff': fp.efficiency_field(grid),
+        'exp': fp.exploration_field(grid),
+        # walking distance from the entrances along the aisles
+        'aisle_dist': distance_field(grid.cells == fp.CellType.AISLE, entrance_mask),
+    }
+
+
+def _run_final(shared, params):
+    fp = shared['fp']
+    random.seed(params['seed'])
+    grid = copy.deepcopy(shared['grid'])
+    fp.run_ca(grid, shared['eff'], shared['exp'], params['target_density'], params['max_attempts'])
+
+    layout = grid.layout(fp.STALL_TYPES)
+    stall_mask = grid.cells == fp.CellType.STALL
+    walkable = (grid.cells == fp.CellType.AISLE) | (grid.cells == fp.CellType.EMPTY)
+    fields = build_flow_fields(walkable, grid.stall_ids, layout.type_id, shared['site']['entrances'])
+    flow = simulate(fields, n_shoppers=params['n_shoppers'], duration=params['duration'], seed=params['seed'])
+
+    # aisle cells that front a stall, and how far they are from the entrances
+    fronts = dilate(stall_mask) & np.isfinite(shared['aisle_dist'])
+    footfall = np.sort(flow['footfall'])[::-1]
+    top = max(1, len(footfall) // 10)
+    row = {
+        'stall_cells': int(stall_mask.sum()),
+        'stalls': len(layout),
+        'mean_front_dist': float(shared['aisle_dist'][fronts].mean()) if fronts.any() else np.nan,
+        'mean_trip_time': flow['mean_trip_time'],
+        'served': flow['served'],
+        'top10_footfall_share': float(footfall[:top].sum() / max(footfall.sum(), 1)),
+        'peak_congestion': int(flow['peak'].max()),
+    }
+    area = np.bincount(layout.type_id, weights=layout.w * layout.h, minlength=len(fp.STALL_TYPES))
+    for idx, st in enumerate(fp.STALL_TYPES):
+        row[f'cells_{st.name}'] = int(area[idx])
+    return row, layout
+
+
+# --- Market01: dual annealing with tunable weights / adjacency strength ---
+
+def _prepare_market01():
+    return {'m': _process_module('Market01')}
+
+
+def _run_market01(shared, params):
+    m = shared['m']
+    wt = {k: params[k] for k in ('circ', 'drain', 'odor', 'adj', 'path')}
+    adj = m.adj_matrix * params['adj_scale']
+    pos, fitness = m.generate_layout(maxiter=params['maxiter'], wt=wt, adj=adj, seed=params['seed'])
+    flow = m.simulate_flow(pos, seed=params['seed']) if pos is not None else None
+    layout = None
+    if pos is not None:
+        xy = pos.reshape(-1, 2).astype(int)
+        layout = m.stall_layout.moved(xy[:, 0], xy[:, 1])
+    return {
+        'fitness': fitness,
+        'valid': pos is not None and fitness < 1e6,
+        'mean_trip_time': flow['mean_trip_time'] if flow is not None else np.nan,
+    }, layout
+
+
+# --- Market02: random sampling with tunable adjacency scores ---
+
+def _prepare_market02():
+    return {'m': _process_module('Market02')}
+
+
+def _run_market02(shared, params):
+    m = shared['m']
+    random.seed(params['seed'])
+    table = {k: params[k] for k in m.ADJ_SCORES}
+    scores = []
+    best = None
+    while len(scores) < params['samples']:
+        result = m.try_place(dict(m.sizes))
+        if result:
+            scores.append(m.score(result[0], table))
+            if best is None or scores[-1] < best[0]:
+                best = (scores[-1], result[0])
+    return {'best_score': best[0], 'mean_score': float(np.mean(scores))}, best[1]
+
+
+# geometry: parameters that define the site (runs sharing them share `prepare`)
+TASKS = {
+    'final': {
+        'geometry': ('width', 'height', 'aisle_spacing', 'aisle_offset'),
+        'defaults': {'width': 40, 'height': 25, 'aisle_spacing': 6, 'aisle_offset': 3,
+                     'target_density': 0.35, 'max_attempts': 5000,
+                     'n_shoppers': 2000, 'duration': 600, 'seed': 0},
+        'prepare': _prepare_final,
+        'run': _run_final,
+    },
+    'market01': {
+        'geometry': (),
+        'defaults': {'circ': 1.0, 'drain': 1.5, 'odor': 2.0, 'adj': 1.5, 'path': 1.0,
+                     'adj_scale': 1.0, 'maxiter': 50, 'seed': 0},
+        'prepare': _prepare_market01,
+        'run': _run_market01,
+    },
+    'market02': {
+        'geometry': (),
+        'defaults': {'fish_cooked': -50, 'same': 10, 'pair': 15, 'other': -5,
+                     'samples': 30, 'seed': 0},
+        'prepare': _prepare_market02,
+        'run': _run_market02,
+    },
+}
+
+
+def grid_design(**axes):
+    """Full factorial design: every combination of the given value lists."""
+    keys = list(axes)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*axes.values())]
+
+
+def random_design(n, seed=None, /, **ranges):
+    """n random configurations; (lo, hi) tuples are sampled uniformly, lists are choices.
+
+    `seed` seeds the design itself; a ``seed`` range in `ranges` samples the run seeds.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for key, spec in ranges.items():
+        if isinstance(spec, tuple):
+            lo, hi = spec
+            if isinstance(lo, int) and isinstance(hi, int):
+                columns[key] = rng.integers(lo, hi + 1, size=n).tolist()
+            else:
+                columns[key] = rng.uniform(lo, hi, size=n).tolist()
+        else:
+            columns[key] = [spec[i] for i in rng.integers(len(spec), size=n)]
+    return [{k: columns[k][i] for k in columns} for i in range(n)]
+
+
+def _layout_csv(layout):
+    rows = ['stall_id,type,x,y,w,h\n']
+    for i, row in enumerate(zip(layout.names, layout.x.tolist(), layout.y.tolist(),
+                                layout.w.tolist(), layout.h.tolist())):
+        rows.append(f'{i},' + ','.join(map(str, row)) + '\n')
+    return ''.join(rows)
+
+
+def _run_group(task, configs, indices, layout_dir=None):
+    """Worker: build the shared site data once, then run every config in the group.
+
+    With `layout_dir`, each run's layout CSV is queued on a background writer
+    as soon as the run finishes, so writing overlaps the next run.
+    """
+    spec = TASKS[task]
+    shared = spec['prepare'](**{k: configs[0][k] for k in spec['geometry']})
+    rows = []
+    with AsyncWriter() as writer:
+        for i, params in zip(indices, configs):
+            start = time.perf_counter()
+            result, layout = spec['run'](shared, params)
+            result['seconds'] = time.perf_counter() - start
+            if layout_dir and layout is not None:
+                result['layout_file'] = os.path.join(layout_dir, f'{task}_{i:05d}.csv')
+                writer.write_text(result['layout_file'], _layout_csv(layout))
+            rows.append({**params, **result})
+    for job, e in writer.errors:
+        print(f'Failed to write {job}:', e)
+    return indices, rows
+
+
+def run_sweep(task, configs, workers=None, layout_dir=None):
+    """Run every configuration of `task` and return the results as one DataFrame.
+
+    Missing parameters take the task defaults.  Rows come back in input order.
+    With `layout_dir`, every run's layout is also saved there as a CSV.
+    """
+    spec = TASKS[task]
+    configs = [{**spec['defaults'], **c} for c in configs]
+    if not configs:
+        return pd.DataFrame()
+    workers = workers or os.cpu_count() or 1
+    if layout_dir:
+        os.makedirs(layout_dir, exist_ok=True)
+
+    groups = {}
+    for i, c in enumerate(configs):
+        groups.setdefault(tuple(c[k] for k in spec['geometry']), []).append(i)
+    # split groups so every worker is busy; each chunk prepares its site once
+    chunks = max(1, workers // len(groups))
+    jobs = []
+    for indices in groups.values():
+        for part in np.array_split(indices, min(chunks, len(indices))):
+            jobs.append([int(i) for i in part])
+
+    rows = [None] * len(configs)
+    if workers == 1:
+        for indices in jobs:
+            _, out = _run_group(task, [configs[i] for i in indices], indices, layout_dir)
+            for i, row in zip(indices, out):
+                rows[i] = row
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_group, task, [configs[i] for i in indices], indices, layout_dir)
+                       for indices in jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                indices, out = future.result()
+                for i, row in zip(indices, out):
+                    rows[i] = row
+                print(f'  {done}/{len(jobs)} groups done')
+    return pd.DataFrame(rows)
+
+
+def _parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep over the market layout generators')
+    parser.add_argument('task', choices=sorted(TASKS))
+    parser.add_argument('params', nargs='*',
+                        help='key=v1,v2,... (full factorial values, or choices with --random) '
+                             'or key=lo:hi (range with --random)')
+    parser.add_argument('--random', type=int, default=0, metavar='N', help='N random configurations instead')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='seeds per configuration: seed*repeats + 0..repeats-1 (seed from a seed= axis, default 0)')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random design')
+    parser.add_argument('--out', default=None, help='CSV path (default outputs/sweep_<task>_<timestamp>.csv)')
+    parser.add_argument('--layouts', default=None, metavar='DIR', help='also save every run\'s layout CSV in DIR')
+    args = parser.parse_intermixed_args()
+
+    axes = {}
+    for item in args.params:
+        key, _, value = item.partition('=')
+        if key not in TASKS[args.task]['defaults']:
+            parser.error(f'unknown parameter {key!r} for {args.task}')
+        if args.random and ':' in value:
+            axes[key] = tuple(_parse_value(v) for v in value.split(':', 1))
+        else:
+            axes[key] = [_parse_value(v) for v in value.split(',')]
+    design = random_design(args.random, args.seed, **axes) if args.random else grid_design(**axes)
+    # each seed= value owns a block of `repeats` consecutive run seeds, so blocks never overlap
+    configs = [{**c, 'seed': c.get('seed', 0) * args.repeats + r} for c in design for r in range(args.repeats)]
+
+    print(f'Sweeping {args.task}: {len(configs)} runs')
+    start = time.perf_counter()
+    results = run_sweep(args.task, configs, workers=args.workers, layout_dir=args.layouts)
+    print(f'Finished in {time.perf_counter() - start:.1f}s')
+
+    os.makedirs('outputs', exist_ok=True)
+    ts = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    out = args.out or f'outputs/sweep_{args.task}_{ts}.csv'
+    results.to_csv(out, index=False)
+    print(results.head(10).to_string())
+    print(f'Saved {len(results)} rows to {out}')
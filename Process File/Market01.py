@@ -5,6 +5,11 @@ from scipy.optimize import dual_annealing
 import json
 import os
 
+from marketlib.async_writer import AsyncWriter, render_figure
+from marketlib.crowd_flow import build_flow_fields, simulate
+from marketlib.feasibility import FeasibleAnchors
+from marketlib.market_core import Layout, StallType
+
 # 1. Data Definition (Stall Types, Sizes, Counts, Adjacency Matrix)
 stall_types = {
     'vegetable': {'size': (3, 3), 'count': 5, 'drain_need': 0, 'odor_level': 1},  # Low odor, no drain
@@ -27,6 +32,11 @@ adj_matrix = np.array([
 # Risk/Weights (for fitness): circulation=1.0, drainage=1.5, odor=2.0, adjacency=1.5, path_eff=1.0
 weights = {'circ': 1.0, 'drain': 1.5, 'odor': 2.0, 'adj': 1.5, 'path': 1.0}
 
+# Ranking only (not part of the fitness): trip time is compared to the best config's,
+# so shoppers walking 10% longer than in the best layout cost 1 fitness point.
+# Fitness spans roughly -25..+5, trip-time excess is typically 0..0.5 -> 0..5 points.
+flow_weight = 10.0
+
 # 2. Site Constraints
 grid_size = (20, 20)  # Width x Height in meters/cells
 entries = [(0, 0), (19, 19)]  # Entry/Exit points
@@ -35,153 +45,211 @@ main_paths[0, :] = 1; main_paths[-1, :] = 1; main_paths[:, 0] = 1; main_paths[:,
 main_paths[9:11, :] = 1  # Central aisle
 drain_points = [(5, 19), (15, 19)]  # Drains at bottom
 
-# Generate list of all stalls with unique IDs
-stall_list = []
-stall_id = 0
-for typ, data in stall_types.items():
-    for i in range(data['count']):
-        stall_list.append({'id': stall_id, 'type': typ, 'size': data['size'], 
-                           'drain_need': data['drain_need'], 'odor_level': data['odor_level']})
-        stall_id += 1
+# All stalls as one struct-of-arrays layout (type order = adjacency matrix order);
+# this model has no wetness attribute, so that column stays 0
+STALL_TYPES = [StallType(typ, odor=data['odor_level'], sizes=[data['size']], drain_need=data['drain_need'])
+               for typ, data in stall_types.items()]
+stall_layout = Layout.from_counts(STALL_TYPES, [data['count'] for data in stall_types.values()])
 
-num_stalls = len(stall_list)
+num_stalls = len(stall_layout)
+_W, _H = stall_layout.w, stall_layout.h
+_I, _J = np.triu_indices(num_stalls, 1)  # every stall pair i < j
+_drains = np.array(drain_points, dtype=float)
+_entries = np.array(entries, dtype=float)
 
 # 3. Generation Strategy (Random Initial + Optimization)
 def place_stalls(positions, grid):
     """Place stalls on grid based on positions (flattened [x1,y1,x2,y2,...]). Return occupied grid."""
     occupied = np.zeros(grid_size)
-    for i in range(num_stalls):
-        x, y = int(positions[2*i]), int(positions[2*i+1])
-        w, h = stall_list[i]['size']
+    xy = np.asarray(positions, dtype=float).reshape(-1, 2).astype(int).tolist()
+    for i, ((x, y), w, h) in enumerate(zip(xy, _W.tolist(), _H.tolist())):
         if x + w > grid_size[0] or y + h > grid_size[1] or np.any(occupied[x:x+w, y:y+h] > 0):
             return None  # Invalid placement (overlap or out-of-bounds)
-        occupied[x:x+w, y:y+h] = stall_list[i]['id'] + 1  # Mark with ID
+        occupied[x:x+w, y:y+h] = i + 1  # Mark with ID
     return occupied
 
-def calculate_fitness(positions):
-    """Fitness Function: Lower is better (minimize penalties)."""
+def calculate_fitness(positions, wt=weights, adj=adj_matrix):
+    """Fitness Function: Lower is better (minimize penalties). wt/adj default to the module settings."""
     occupied = place_stalls(positions, np.zeros(grid_size))
     if occupied is None:
         return 1e6  # High penalty for invalid
     
     # Helper: Get center of each stall
-    centers = []
-    for i in range(num_stalls):
-        x, y = int(positions[2*i]), int(positions[2*i+1])
-        w, h = stall_list[i]['size']
-        centers.append((x + w/2, y + h/2))
+    xy = np.asarray(positions, dtype=float).reshape(-1, 2).astype(int)
+    cx, cy = xy[:, 0] + _W / 2, xy[:, 1] + _H / 2
     
     # a. Circulation Blockage: Penalty if stalls block main paths
     blockage = np.sum(occupied * main_paths) / np.sum(main_paths) * 100  # % blocked
     
     # b. Drainage Efficiency: Distance from high-drain stalls to nearest drain
-    drain_pen = 0
-    for i, stall in enumerate(stall_list):
-        if stall['drain_need'] > 0:
-            dists = [np.linalg.norm(np.array(centers[i]) - np.array(d)) for d in drain_points]
-            drain_pen += min(dists) * stall['drain_need']
-    drain_pen /= num_stalls
+    need = stall_layout.drain_need
+    drain_dist = np.hypot(cx[:, None] - _drains[:, 0], cy[:, None] - _drains[:, 1]).min(axis=1)
+    drain_pen = np.sum(np.where(need > 0, drain_dist * need, 0)) / num_stalls
     
     # c. Odor Pollution: High-odor stalls near sensitive ones
-    odor_pen = 0
-    for i in range(num_stalls):
-        for j in range(i+1, num_stalls):
-            dist = np.linalg.norm(np.array(centers[i]) - np.array(centers[j]))
-            odor_diff = abs(stall_list[i]['odor_level'] - stall_list[j]['odor_level'])
-            if dist < 5:  # Close proximity threshold
-                odor_pen += odor_diff / dist if dist > 0 else 10
+    dist = np.hypot(cx[_I] - cx[_J], cy[_I] - cy[_J])
+    safe = np.where(dist > 0, dist, 1)
+    odor_diff = np.abs(stall_layout.odor[_I] - stall_layout.odor[_J])
+    odor_pen = np.sum(np.where(dist < 5, np.where(dist > 0, odor_diff / safe, 10), 0))  # Close proximity threshold
     odor_pen /= num_stalls * (num_stalls - 1) / 2
     
     # d. Adjacency Score: Based on matrix
-    adj_score = 0
-    type_idx = {t: i for i, t in enumerate(stall_types.keys())}
-    for i in range(num_stalls):
-        for j in range(i+1, num_stalls):
-            dist = np.linalg.norm(np.array(centers[i]) - np.array(centers[j]))
-            pref = adj_matrix[type_idx[stall_list[i]['type']], type_idx[stall_list[j]['type']]]
-            adj_score += pref / dist if dist > 0 else pref * 10  # Closer if positive, farther if negative
+    pref = adj[stall_layout.type_id[_I], stall_layout.type_id[_J]]
+    adj_score = np.sum(np.where(dist > 0, pref / safe, pref * 10))  # Closer if positive, farther if negative
     adj_score = -adj_score  # Since positive pref should reduce penalty
     
     # e. Path Efficiency: Average distance from entries to stall centers
-    path_pen = 0
-    for center in centers:
-        dists = [np.linalg.norm(np.array(center) - np.array(e)) for e in entries]
-        path_pen += min(dists)
-    path_pen /= num_stalls
+    path_pen = np.hypot(cx[:, None] - _entries[:, 0], cy[:, None] - _entries[:, 1]).min(axis=1).mean()
     
     # Weighted total (minimize)
-    total = (weights['circ'] * blockage + weights['drain'] * drain_pen + 
-             weights['odor'] * odor_pen + weights['adj'] * adj_score + 
-             weights['path'] * path_pen)
+    total = (wt['circ'] * blockage + wt['drain'] * drain_pen + 
+             wt['odor'] * odor_pen + wt['adj'] * adj_score + 
+             wt['path'] * path_pen)
     return total
 
+def simulate_flow(positions, n_shoppers=2000, seed=None):
+    """Crowd-flow simulation of a layout: per-stall footfall and mean trip time."""
+    occupied = place_stalls(positions, np.zeros(grid_size))
+    if occupied is None:
+        return None
+    # occupied is indexed [x, y]; the flow engine works on [y, x] arrays
+    stall_ids = occupied.T.astype(int) - 1
+    fields = build_flow_fields(stall_ids < 0, stall_ids, stall_layout.type_id, entries)
+    return simulate(fields, n_shoppers=n_shoppers, duration=300, seed=seed)
+
 # Optimization Bounds: Each stall position (x,y) in [0, grid_size - size]
 bounds = []
-for stall in stall_list:
-    bounds.extend([(0, grid_size[0] - stall['size'][0]), (0, grid_size[1] - stall['size'][1])])
-
-# 4. Run Optimization (Simulated Annealing via dual_annealing)
-def generate_layout():
-    res = dual_annealing(calculate_fitness, bounds, maxiter=500)
+for w, h in zip(_W.tolist(), _H.tolist()):
+    bounds.extend([(0, grid_size[0] - w), (0, grid_size[1] - h)])
+
+def feasible_layout(seed=None, tries=50):
+    """Random layout drawn only from legal anchors (off main paths, no overlap); None if every try fails.
+
+    Only used as the annealing start point: dual_annealing draws its own proposals
+    inside `bounds` and cannot be restricted to these masks.
+    """
+    rng = np.random.default_rng(seed)
+    randrange = lambda n: int(rng.integers(n))
+    # largest footprints first, they have the fewest legal anchors
+    order = np.argsort(-(_W * _H), kind='stable').tolist()
+    sizes = list(zip(_W.tolist(), _H.tolist()))
+    for _ in range(tries):
+        anchors = FeasibleAnchors(main_paths > 0, sizes)
+        positions = np.zeros(2 * num_stalls)
+        for i in order:
+            spot = anchors.sample(sizes[i], randrange)
+            if spot is None:
+                break
+            anchors.place(*spot, sizes[i])
+            positions[2*i:2*i+2] = spot
+        else:
+            return positions
+    return None
+
+# 4. Run Optimization (Simulated Annealing via dual_annealing, started from a feasible layout)
+def generate_layout(maxiter=500, wt=weights, adj=adj_matrix, seed=None):
+    """Anneal from a feasible x0. Later proposals are not drawn from the anchor masks:
+    overlapping candidates are still rejected by calculate_fitness (1e6) and ones on
+    the main paths are only penalized through the blockage term."""
+    x0 = feasible_layout(seed)
+    res = dual_annealing(calculate_fitness, bounds, args=(wt, adj), maxiter=maxiter, seed=seed, x0=x0)
     if res.success:
         return res.x, res.fun
     return None, 1e6
 
-# Generate 30 configurations
-configs = []
-for i in range(30):
-    pos, fitness = generate_layout()
-    if pos is not None:
-        configs.append({'id': i, 'positions': pos, 'fitness': fitness})
-    print(f"Config {i}: Fitness {fitness}")
+# 5. Visualization & Output
+def config_layout(conf):
+    """Layout of one config (positions flattened [x1,y1,x2,y2,...])."""
+    xy = np.asarray(conf['positions']).reshape(-1, 2).astype(int)
+    return stall_layout.moved(xy[:, 0], xy[:, 1])
 
-# Select top 5 for visualization (lowest fitness)
-top_configs = sorted(configs, key=lambda c: c['fitness'])[:5]
+def export_config(conf, writer):
+    """Queue the stall CSV and params JSON of one config on the background writer (cheap, done for every config)."""
+    layout = config_layout(conf)
 
-# 5. Visualization & Output
-os.makedirs('outputs', exist_ok=True)
+    # CSV Output: Stall positions for external use (e.g., Grasshopper)
+    df = pd.DataFrame({'stall_id': np.arange(num_stalls), 'type': layout.names, 'x': layout.x, 'y': layout.y,
+                       'w': layout.w, 'h': layout.h,
+                       'footfall': conf['flow']['footfall'].astype(int) if conf['flow'] is not None else 0})
+    writer.submit(df.to_csv, f"outputs/layout_{conf['id']}.csv", index=False)
 
-for conf in top_configs:
+    # JSON for Adjacency/Params
+    writer.write_text(f"outputs/params_{conf['id']}.json",
+                      json.dumps({'adj_matrix': adj_matrix.tolist(), 'weights': weights, 'fitness': conf['fitness'],
+                                  'mean_trip_time': conf['trip']}))
+
+def export_plots(conf, writer):
+    """Draw the layout plot and odor heatmap of one config and queue the PNGs (only for the final top 5)."""
     occupied = place_stalls(conf['positions'], np.zeros(grid_size))
-    
+    layout = config_layout(conf)
+    names = layout.names
+
     # Layout Plot
-    plt.figure(figsize=(10, 10))
+    fig = plt.figure(figsize=(10, 10))
     plt.imshow(occupied, cmap='tab20', interpolation='nearest')
     plt.title(f"Layout Config {conf['id']} (Fitness: {conf['fitness']:.2f})")
-    for i, center in enumerate([(int(conf['positions'][2*j]), int(conf['positions'][2*j+1])) for j in range(num_stalls)]):
-        plt.text(center[0], center[1], stall_list[i]['type'][0], color='white', ha='center', va='center')
-    plt.savefig(f"outputs/layout_{conf['id']}.png")
-    plt.close()
-    
+    for x, y, name in zip(layout.x.tolist(), layout.y.tolist(), names):
+        plt.text(x, y, name[0], color='white', ha='center', va='center')
+    # rendered here (matplotlib is not thread-safe); only PNG encoding runs on the writer thread
+    writer.write_png(f"outputs/layout_{conf['id']}.png", render_figure(fig))
+    plt.close(fig)
+
     # Heatmap: Example - Odor Distribution
-    odor_map = np.zeros(grid_size)
-    for i, stall in enumerate(stall_list):
-        x, y = int(conf['positions'][2*i]), int(conf['positions'][2*i+1])
-        w, h = stall['size']
-        odor_map[x:x+w, y:y+h] = stall['odor_level']
-    plt.figure(figsize=(10, 10))
+    cells = layout.rasterize(*grid_size).T  # back to this file's [x, y] indexing
+    odor_map = np.where(cells >= 0, layout.odor[cells], 0).astype(float)
+    fig = plt.figure(figsize=(10, 10))
     plt.imshow(odor_map, cmap='hot', interpolation='nearest')
     plt.title(f"Odor Heatmap Config {conf['id']}")
     plt.colorbar()
-    plt.savefig(f"outputs/odor_heatmap_{conf['id']}.png")
-    plt.close()
-    
-    # CSV Output: Stall positions for external use (e.g., Grasshopper)
-    df = pd.DataFrame([{'stall_id': s['id'], 'type': s['type'], 'x': int(conf['positions'][2*idx]), 
-                        'y': int(conf['positions'][2*idx+1]), 'w': s['size'][0], 'h': s['size'][1]}
-                       for idx, s in enumerate(stall_list)])
-    df.to_csv(f"outputs/layout_{conf['id']}.csv", index=False)
-    
-    # JSON for Adjacency/Params
-    with open(f"outputs/params_{conf['id']}.json", 'w') as f:
-        json.dump({'adj_matrix': adj_matrix.tolist(), 'weights': weights, 'fitness': conf['fitness']}, f)
-
-# Summary Report (Text File)
-with open('outputs/report.txt', 'w') as f:
-    f.write("Market Layout Generation Report\n")
-    f.write("Generated 30 configs; top 5 visualized.\n")
-    f.write("Emergent Patterns: Wet zones (fish/meat) cluster near drains; dry/cooked near entries/paths.\n")
-    f.write("Insights: Optimization reveals zoning (e.g., wet/dry separation) and path-oriented clustering, mirroring real markets.\n")
-    f.write("Complexity Emerges: From random starts, logic drives functional organization without explicit zoning rules.\n")
-
-print("Generation complete. Check 'outputs' folder for layouts, heatmaps, CSV, JSON, and report.")
\ No newline at end of file
+    writer.write_png(f"outputs/odor_heatmap_{conf['id']}.png", render_figure(fig))
+    plt.close(fig)
+
+if __name__ == "__main__":
+    os.makedirs('outputs', exist_ok=True)
+    # each config's CSV/JSON is queued as soon as it is ready and written while the next one is optimized;
+    # the (slow) plots are drawn only for the final top 5
+    writer = AsyncWriter()
+
+    # Generate 30 configurations
+    configs = []
+    for i in range(30):
+        pos, fitness = generate_layout()
+        print(f"Config {i}: Fitness {fitness}")
+        if pos is None:
+            continue
+        conf = {'id': i, 'positions': pos, 'fitness': fitness}
+        conf['flow'] = simulate_flow(pos, seed=i)
+        conf['trip'] = conf['flow']['mean_trip_time'] if conf['flow'] is not None else np.nan
+        export_config(conf, writer)
+        configs.append(conf)
+
+    # Crowd-flow ranking: fitness plus the trip time relative to the best config
+    trips = [c['trip'] for c in configs if np.isfinite(c['trip'])]
+    best_trip = min(trips) if trips else np.nan
+    for conf in configs:
+        excess = conf['trip'] / best_trip - 1
+        conf['rank_score'] = conf['fitness'] + flow_weight * excess if np.isfinite(excess) else 1e6
+        print(f"Config {conf['id']}: mean trip time {conf['trip']:.1f}, rank score {conf['rank_score']:.2f}")
+
+    # Top 5 (lowest rank score)
+    ranked = sorted(configs, key=lambda c: c['rank_score'])
+    top_ids = [c['id'] for c in ranked[:5]]
+    for conf in ranked[:5]:
+        export_plots(conf, writer)
+    ranking = pd.DataFrame({'id': [c['id'] for c in ranked], 'fitness': [c['fitness'] for c in ranked],
+                            'mean_trip_time': [c['trip'] for c in ranked],
+                            'rank_score': [c['rank_score'] for c in ranked]})
+    writer.submit(ranking.to_csv, 'outputs/ranking.csv', index=False)
+
+    # Summary Report (Text File)
+    writer.write_text('outputs/report.txt',
+                      "Market Layout Generation Report\n"
+                      f"Generated 30 configs ({len(configs)} valid, CSV/JSON for each); top 5 by rank score visualized: {top_ids} (see ranking.csv, flow_weight={flow_weight}).\n"
+                      "Emergent Patterns: Wet zones (fish/meat) cluster near drains; dry/cooked near entries/paths.\n"
+                      "Insights: Optimization reveals zoning (e.g., wet/dry separation) and path-oriented clustering, mirroring real markets.\n"
+                      "Complexity Emerges: From random starts, logic drives functional organization without explicit zoning rules.\n")
+    writer.close()
+    for job, e in writer.errors:
+        print(f"Failed to write {job}:", e)
+
+    print("Generation complete. Check 'outputs' folder for layouts, heatmaps, CSV, JSON, ranking and report.")
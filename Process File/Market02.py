@@ -1,10 +1,25 @@
-# 純內建版市場生成器（不需要安裝任何套件！）
+# 極簡版市場生成器（相依套件統一列在 pyproject.toml / README）
+import argparse
 import random
 import json
 import os
-from math import sqrt
 
-# 資料設定（同之前）
+import numpy as np
+
+# 共用模組（marketlib，安裝方式見 README）
+from marketlib.async_writer import AsyncWriter
+# 預先算好每種尺寸的合法左上角
+from marketlib.feasibility import FeasibleAnchors
+from marketlib.market_core import Layout, StallType
+
+# 資料設定（同之前）；排水需求只記在 drain_need，wetness 欄位維持 0（同 Market01）
+STALL_TYPES = [StallType('蔬菜', sizes=[(3,3)]),
+               StallType('肉', sizes=[(4,3)], drain_need=1),
+               StallType('魚', sizes=[(4,4)], drain_need=1),
+               StallType('熟食', sizes=[(3,2)]),
+               StallType('乾貨', sizes=[(2,2)])]
+type_index = {t.name: k for k, t in enumerate(STALL_TYPES)}
+
 stall_types = ['蔬菜','蔬菜','蔬菜','蔬菜','蔬菜',
                '肉','肉','肉',
                '魚','魚',
@@ -16,89 +31,143 @@ grid_w, grid_h = 20, 20
 drains = [(5,19), (15,19)]
 entries = [(0,0), (19,19)]
 
-# 簡單鄰接分數（魚跟熟食互相討厭）
-def adj_score(t1, t2):
-    if {'魚','熟食'} == {t1,t2}: return -50
-    if t1 == t2: return +10
-    if {t1,t2} in [{'魚','肉'},{'蔬菜','乾貨'}]: return +15
-    return -5
+# 簡單鄰接分數（魚跟熟食互相討厭），數值可由參數掃描覆寫
+ADJ_SCORES = {'fish_cooked': -50, 'same': +10, 'pair': +15, 'other': -5}
+
+def adj_score(t1, t2, table=ADJ_SCORES):
+    if {'魚','熟食'} == {t1,t2}: return table['fish_cooked']
+    if t1 == t2: return table['same']
+    if {t1,t2} in [{'魚','肉'},{'蔬菜','乾貨'}]: return table['pair']
+    return table['other']
+
+def make_layout(stalls=sizes):
+    """
+    依 stall_types 建立所有攤位的 Layout（位置先放在 (0, 0)）。
+
+    尺寸依 stalls 的插入順序逐一分配給攤位；數量不夠時回傳 None。
+    """
+    dims = [size for size, count in stalls.items() for _ in range(count)][:len(stall_types)]
+    if len(dims) < len(stall_types):
+        return None
+    w, h = np.array(dims).T
+    return Layout(STALL_TYPES, [type_index[t] for t in stall_types], w=w, h=h)
+
+def pair_scores(layout, table=ADJ_SCORES):
+    """(N, N) 每對攤位的鄰接分數（對角線為 0）。"""
+    by_type = np.array([[adj_score(a.name, b.name, table) for b in STALL_TYPES] for a in STALL_TYPES], dtype=float)
+    pair = by_type[layout.type_id[:, None], layout.type_id[None, :]]
+    np.fill_diagonal(pair, 0)
+    return pair
 
 # 放置攤位
 def try_place(stalls):
-    grid = [[0]*grid_w for _ in range(grid_h)]
-    placed = []
-    counts = dict(stalls)  # 使用傳入的副本來追蹤剩餘數量
-    for i, typ in enumerate(stall_types):
-        # 取得下一個尚有數量的尺寸 (w,h)
-        try:
-            size = next(k for k, v in counts.items() if v > 0)
-        except StopIteration:
+    layout = make_layout(stalls)
+    if layout is None:
+        return None
+    # grid 是 [y][x]，所以遮罩的尺寸順序為 (h, w)
+    anchors = FeasibleAnchors(np.zeros((grid_h, grid_w), dtype=bool), list(zip(layout.h.tolist(), layout.w.tolist())))
+    for i, (w, h) in enumerate(zip(layout.w.tolist(), layout.h.tolist())):
+        # 只從合法的左上角抽樣，放下後更新所有尺寸的遮罩
+        spot = anchors.sample((h, w), random.randrange)
+        if spot is None:
             return None
-        w, h = size
-        counts[size] -= 1
-
-        for _ in range(1000):
-            x = random.randint(0, grid_w - w)
-            y = random.randint(0, grid_h - h)
-            if all(grid[y+dy][x+dx] == 0 for dx in range(w) for dy in range(h)):
-                for dx in range(w):
-                    for dy in range(h):
-                        grid[y+dy][x+dx] = i+1
-                placed.append({"id": i, "type": typ, "x": x, "y": y, "w": w, "h": h})
-                break
-        else:
-            return None
-    return placed, grid
+        y, x = spot
+        anchors.place(y, x, (h, w))
+        layout.x[i], layout.y[i] = x, y
+    return layout, layout.rasterize(grid_w, grid_h)
+
+def score_centers(cx, cy, need, pair):
+    """
+    依攤位中心計算分數（越低越好），cx / cy 可以多一個族群維度 (P, N)：
+    有排水需求的攤位到最近排水口的距離，減去所有攤位對的 鄰接分數 / max(距離, 1)。
+    """
+    d = np.array(drains, dtype=float)
+    d_drain = np.sqrt((cx[..., None] - d[:, 0]) ** 2 + (cy[..., None] - d[:, 1]) ** 2).min(axis=-1)
+    dist = np.sqrt((cx[..., :, None] - cx[..., None, :]) ** 2 + (cy[..., :, None] - cy[..., None, :]) ** 2)
+    return (d_drain * need).sum(axis=-1) - (pair / np.maximum(dist, 1)).sum(axis=(-2, -1))
 
 # 計算簡單評分
-def score(placed):
-    s = 0
-    for p in placed:
-        cx = p["x"] + p["w"]/2
-        cy = p["y"] + p["h"]/2
-        # 排水分
-        if p["type"] in ["魚","肉"]:
-            d = min(sqrt((cx-dx)**2 + (cy-dy)**2) for dx,dy in drains)
-            s += d
-        # 氣味分
-        for q in placed:
-            if p["id"] != q["id"]:
-                dx = (p["x"]+p["w"]/2) - (q["x"]+q["w"]/2)
-                dy = (p["y"]+p["h"]/2) - (q["y"]+q["h"]/2)
-                dist = max(sqrt(dx*dx + dy*dy), 1)
-                s -= adj_score(p["type"], q["type"]) / dist
-    return s
-
-# 產生 30 個
-os.makedirs("極簡版結果", exist_ok=True)
-best = []
-for i in range(30):
-    while True:
-        result = try_place(dict(sizes))
-        if result:
-            placed, grid = result
-            sc = score(placed)
-            best.append((sc, placed, grid))
-            print(f"第{i+1:2d}個完成，分數 {sc:.1f}")
-            break
-
-best.sort()
-for idx, (sc, placed, grid) in enumerate(best[:10]):  # 取前10名
-    with open(f"極簡版結果/第{idx+1}_名_分數{sc:.0f}.csv", "w", encoding="utf-8") as f:
-        f.write("id,類型,x,y,寬,高\n")
-        for p in placed:
-            f.write(f"{p['id']},{p['type']},{p['x']},{p['y']},{p['w']},{p['h']}\n")
-    
-    # 產生超簡單文字圖
-    with open(f"極簡版結果/第{idx+1}_名_分數{sc:.0f}.txt", "w", encoding="utf-8") as f:
-        legend = "蔬=蔬菜 肉=肉 魚=魚 熟=熟食 乾=乾貨\n"
-        f.write(legend + "\n")
-        txt = "\n".join("".join("蔬" if c and stall_types[c-1]=="蔬菜" else
-                               "肉" if c and stall_types[c-1]=="肉" else
-                               "魚" if c and stall_types[c-1]=="魚" else
-                               "熟" if c and stall_types[c-1]=="熟食" else
-                               "乾" if c and stall_types[c-1]=="乾貨" else "．"
-                               for c in row) for row in grid)
-        f.write(txt)
-
-print("全部完成！請到「極簡版結果」資料夾看前10名（CSV + 文字平面圖）")
\ No newline at end of file
+def score(layout, table=ADJ_SCORES):
+    cx, cy = layout.centers()
+    return float(score_centers(cx, cy, layout.drain_need > 0, pair_scores(layout, table)))
+
+# 輸出一個配置（CSV + 文字平面圖），實際寫檔由背景執行緒處理
+def export_layout(writer, stem, layout, grid):
+    names = layout.names
+    rows = ["id,類型,x,y,寬,高\n"]
+    for i, row in enumerate(zip(names, layout.x.tolist(), layout.y.tolist(), layout.w.tolist(), layout.h.tolist())):
+        rows.append(f"{i}," + ",".join(map(str, row)) + "\n")
+    writer.write_text(f"{stem}.csv", "".join(rows))
+
+    # 產生超簡單文字圖（grid 為攤位編號，-1 表示空地）
+    legend = "蔬=蔬菜 肉=肉 魚=魚 熟=熟食 乾=乾貨\n"
+    marks = [name[0] for name in names] + ["．"]
+    txt = "\n".join("".join(marks[c] for c in row) for row in grid.tolist())
+    writer.write_text(f"{stem}.txt", legend + "\n" + txt)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="極簡版市場攤位生成器")
+    parser.add_argument("--ga", action="store_true", help="改用基因演算法")
+    parser.add_argument("--population", type=int, default=100, help="族群大小 (預設 100)")
+    parser.add_argument("--generations", type=int, default=200, help="演化代數 (預設 200)")
+    parser.add_argument("--time-budget", type=float, default=None, help="GA 演化秒數上限（預設只看代數）")
+    parser.add_argument("--seed", type=int, default=None, help="亂數種子")
+    args = parser.parse_args()
+    random.seed(args.seed)  # 兩種模式都用同一個種子（GA 另外以 seed 建立 numpy 的 Generator）
+
+    os.makedirs("極簡版結果", exist_ok=True)
+    # 檔案寫入交給背景執行緒，主程式不必等磁碟（GA 的目前最佳會在演化途中送出）
+    writer = AsyncWriter()
+    best = []
+    if args.ga:
+        import market02_ga
+
+        current = {"best": 1e6}
+
+        def snapshot(gen, pos, scores):
+            # 最佳分數進步時，輸出目前最佳的配置（覆寫同一組檔案）
+            i = int(scores.argmin())
+            if scores[i] < current["best"]:
+                current["best"] = scores[i]
+                export_layout(writer, "極簡版結果/GA_目前最佳", *market02_ga.to_layout(pos[i]))
+
+        pos, scores, history = market02_ga.evolve(population=args.population, generations=args.generations,
+                                                  time_budget=args.time_budget, seed=args.seed, callback=snapshot)
+        print(f"演化 {len(history) - 1} 代，最佳分數 {history[0]:.1f} → {history[-1]:.1f}")
+        # 最後一代中不重複的合法個體，依分數排名輸出前10名
+        seen = set()
+        for ind, sc in zip(pos, scores):
+            key = ind.tobytes()
+            if sc >= 1e6 or key in seen:
+                continue
+            seen.add(key)
+            stem = f"極簡版結果/第{len(best)+1}_名_分數{sc:.0f}"
+            export_layout(writer, stem, *market02_ga.to_layout(ind))
+            best.append((float(sc), stem))
+            if len(best) == 10:
+                break
+    else:
+        # 產生 30 個，排名後輸出前10名（檔名與 GA 模式相同）
+        samples = []
+        for i in range(30):
+            while True:
+                result = try_place(dict(sizes))
+                if result:
+                    samples.append((score(result[0]), result))
+                    print(f"第{i+1:2d}個完成，分數 {samples[-1][0]:.1f}")
+                    break
+        samples.sort(key=lambda s: s[0])
+        for sc, result in samples[:10]:
+            stem = f"極簡版結果/第{len(best)+1}_名_分數{sc:.0f}"
+            export_layout(writer, stem, *result)
+            best.append((sc, stem))
+
+    best.sort(key=lambda b: b[0])
+    writer.write_text("極簡版結果/排名.txt",
+                      "".join(f"第{idx+1}名 分數 {sc:.1f} {os.path.basename(stem)}\n"
+                              for idx, (sc, stem) in enumerate(best[:10])))
+    writer.close()
+    for job, e in writer.errors:
+        print(f"寫入失敗 {job}:", e)
+
+    print("全部完成！請到「極簡版結果」資料夾看「排名.txt」列出的前10名（CSV + 文字平面圖）")
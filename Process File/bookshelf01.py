@@ -1,5 +1,4 @@
-import compas
-import compas.geometry as cg
+from bookshelf_pack import make_books, pack_row, iter_boxes
 # 為了視覺化結果，可能還需要 compas_viewer
 # from compas_viewer import Viewer
 
@@ -14,35 +13,9 @@ def create_conceptual_bookshelf(book_dimensions):
     Returns:
         list: 包含所有已定位書本的 cg.Box 物件列表。
     """
-    bookshelf_geometries = []
-    current_x_position = 0.0  # 用於追蹤下一本書沿 X 軸擺放的起始位置
-
-    # 迭代處理每一本書的尺寸
-    for L, W, H in book_dimensions:
-        # 1. 創建一個 Box 物件 (表示單本書)
-        # 注意：compas.geometry.Box 的簽名為 (xsize, ysize, zsize, frame=...)
-        book_box = cg.Box(L, W, H, frame=cg.Frame.worldXY())
-
-        # 2. 計算位移向量 (Translation Vector)
-        tx = current_x_position + L / 2
-        ty = W / 2
-        tz = H / 2
-
-        translation_vector = [tx, ty, tz]
-
-        # 創建位移變換 (Translation) 物件
-        T = cg.Translation.from_vector(translation_vector)
-
-        # 3. 應用變換
-        book_box.transform(T)
-
-        # 4. 儲存結果
-        bookshelf_geometries.append(book_box)
-
-        # 5. 更新下一個書本的起始位置
-        current_x_position += L # 下一本書從當前書本的結束位置開始
-
-    return bookshelf_geometries
+    # 位置以陣列一次算完（書本緊貼排列），再轉成 cg.Box
+    books = pack_row(make_books(book_dimensions), gap=0.0)
+    return list(iter_boxes(books))
 
 # --- 使用範例 ---
 # 假設我們有三本書的尺寸 (長度 L, 寬度 W, 高度 H)
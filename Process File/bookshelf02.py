@@ -1,7 +1,6 @@
-import compas
-import compas.geometry as cg
 import argparse
-import random
+import numpy as np
+from bookshelf_pack import make_books, make_shelves, pack_row, pack_shelves, iter_boxes, save_csv
 # 為了視覺化結果，可能還需要 compas_viewer
 from compas_viewer import Viewer
 
@@ -20,37 +19,11 @@ def create_conceptual_bookshelf(book_dimensions, gap=0.02, random_gaps=True, gap
                list_of_boxes 為已定位的 cg.Box 物件列表。
                list_of_gaps 為每本書之後使用的間隙值 (最後一本之後的間隙為 None)。
     """
-    bookshelf_geometries = []
-    gaps = []
-    current_x_position = 0.0  # 用於追蹤下一本書沿 X 軸擺放的起始位置
-
-    n = len(book_dimensions)
-    for i, (L, W, H) in enumerate(book_dimensions):
-        book_box = cg.Box(L, W, H, frame=cg.Frame.worldXY())
-
-        tx = current_x_position + L / 2
-        ty = W / 2
-        tz = H / 2
-        translation_vector = [tx, ty, tz]
-        T = cg.Translation.from_vector(translation_vector)
-        book_box.transform(T)
-
-        bookshelf_geometries.append(book_box)
-
-        # 如果不是最後一本，決定並記錄本次使用的間隙，然後更新位置
-        if i < n - 1:
-            if random_gaps:
-                # 保證 gap_min <= gap_max
-                lo, hi = (gap_min, gap_max) if gap_min <= gap_max else (gap_max, gap_min)
-                current_gap = random.uniform(lo, hi)
-            else:
-                current_gap = gap
-            gaps.append(current_gap)
-            current_x_position += L + current_gap
-        else:
-            gaps.append(None)  # 最後一本之後沒有間隙
-
-    return bookshelf_geometries, gaps
+    # 位置與間隙以陣列一次算完，再轉成 cg.Box
+    books = pack_row(make_books(book_dimensions), gap=gap, random_gaps=random_gaps,
+                     gap_min=gap_min, gap_max=gap_max)
+    gaps = [None if np.isnan(g) else float(g) for g in books['gap']]  # 最後一本之後沒有間隙
+    return list(iter_boxes(books)), gaps
 
 # --- 使用範例 ---
 # 假設我們有三本書的尺寸 (長度 L, 寬度 W, 高度 H)
@@ -68,21 +41,53 @@ if __name__ == "__main__":
     parser.add_argument("--random-gaps", action="store_true", help="若啟用則每個間隙為隨機值")
     parser.add_argument("--gap-min", type=float, default=0.01, help="隨機間隙最小值 (預設 0.01)")
     parser.add_argument("--gap-max", type=float, default=0.05, help="隨機間隙最大值 (預設 0.05)")
+    parser.add_argument("--books", type=int, default=0, help="隨機產生 N 本書取代範例書本 (可到 100k 以上)")
+    parser.add_argument("--view", type=int, default=200, help="最多建立並顯示幾本書的 cg.Box (預設 200)")
+    parser.add_argument("--csv", help="將所有書本的位置輸出成 CSV")
+    parser.add_argument("--inventory", help="從 CSV 讀入書本尺寸 (欄位 L,W,H，第一列為標題)")
+    parser.add_argument("--pack", action="store_true", help="裝箱模式：把書本裝進多層有尺寸限制的層板")
+    parser.add_argument("--shelves", type=int, default=5, help="層板數量 (預設 5)")
+    parser.add_argument("--shelf-length", type=float, default=1.0, help="層板長度 (預設 1.0)")
+    parser.add_argument("--shelf-height", type=float, default=0.35, help="層板淨高 (預設 0.35)")
+    parser.add_argument("--shelf-depth", type=float, default=0.30, help="層板深度 (預設 0.30)")
     args = parser.parse_args()
 
-    if args.random_gaps:
-        bookshelf, gaps = create_conceptual_bookshelf(input_book_sizes,
-                                                      random_gaps=True,
-                                                      gap_min=args.gap_min,
-                                                      gap_max=args.gap_max)
+    if args.inventory:
+        book_sizes = np.loadtxt(args.inventory, delimiter=",", skiprows=1, usecols=(0, 1, 2), ndmin=2)
+    elif args.books > 0:
+        rng = np.random.default_rng()
+        book_sizes = np.column_stack([rng.uniform(0.01, 0.08, args.books),   # 書脊厚度
+                                      rng.uniform(0.15, 0.30, args.books),   # 深度
+                                      rng.uniform(0.18, 0.35, args.books)])  # 高度
+    else:
+        book_sizes = input_book_sizes
+
+    # 大量書本只保留陣列，幾何物件只為檢視的前 --view 本建立
+    if args.pack:
+        shelves = make_shelves(args.shelves, args.shelf_length, args.shelf_height, args.shelf_depth)
+        books, report = pack_shelves(make_books(book_sizes), shelves)
+        n_placed = int((books['shelf'] >= 0).sum())
+        print(f"裝箱完成：{len(books)} 本中放入 {n_placed} 本")
+        if n_placed == 0:
+            print("沒有任何書本放得進層板，請檢查 --shelf-height / --shelf-depth 是否小於書本尺寸")
+        for i, r in enumerate(report):
+            print(f"Shelf {i+1}: {r['count']} 本, 長度使用率 {r['linear_fill']:.1%}, "
+                  f"體積填充率 {r['fill_ratio']:.1%}, 可取用率 {r['accessibility']:.1%}")
+        shown = np.flatnonzero(books['shelf'] >= 0)[:args.view]
     else:
-        bookshelf, gaps = create_conceptual_bookshelf(input_book_sizes, gap=args.gap)
+        books = pack_row(make_books(book_sizes), gap=args.gap, random_gaps=args.random_gaps,
+                         gap_min=args.gap_min, gap_max=args.gap_max)
+        shown = range(min(args.view, len(books)))
+    bookshelf = list(iter_boxes(books, shown))
+    if args.csv:
+        save_csv(books, args.csv)
 
-    print(f"概念性書架空間生成完成（random_gaps={args.random_gaps}）:")
-    for i, book in enumerate(bookshelf):
-        L, W, H = input_book_sizes[i]
+    print(f"概念性書架空間生成完成（random_gaps={args.random_gaps}，共 {len(books)} 本，顯示 {len(bookshelf)} 本）:")
+    for i, book in zip(shown, bookshelf):
+        L, W, H = books['L'][i], books['W'][i], books['H'][i]
+        gap_after = None if np.isnan(books['gap'][i]) else books['gap'][i]
         # Box 的 frame.point 是其中心點
-        print(f"Book {i+1} (L={L}, W={W}, H={H}) 的中心點位置: {book.frame.point}  — gap after: {gaps[i]}")
+        print(f"Book {i+1} (L={L:.3f}, W={W:.3f}, H={H:.3f}) 的中心點位置: {book.frame.point}  — gap after: {gap_after}")
 
     # 視覺化 (需要安裝 compas_viewer)
     try:
@@ -0,0 +1,220 @@
+from bisect import bisect_left, insort
+
+import numpy as np
+
+# 每本書一筆紀錄：尺寸 (L, W, H)、中心點位置 (x, y, z)、所在層板編號、之後的間隙
+BOOK_DTYPE = np.dtype([
+    ('L', 'f8'), ('W', 'f8'), ('H', 'f8'),
+    ('x', 'f8'), ('y', 'f8'), ('z', 'f8'),
+    ('shelf', 'i4'),
+    ('gap', 'f8'),
+])
+
+# 每一層板：可用長度、淨高、深度、底面高度 z
+SHELF_DTYPE = np.dtype([
+    ('length', 'f8'), ('height', 'f8'), ('depth', 'f8'), ('z', 'f8'),
+])
+
+# 每一層板的排列結果
+SHELF_REPORT_DTYPE = np.dtype([
+    ('count', 'i4'),
+    ('used', 'f8'),           # 書脊 + 間隙佔用的長度
+    ('linear_fill', 'f8'),    # used / length
+    ('fill_ratio', 'f8'),     # 書本體積 / 層板體積
+    ('accessibility', 'f8'),  # 書頂或左右一側留有抽書空間的書本比例
+])
+
+
+def make_books(book_dimensions):
+    """
+    將書本尺寸轉成結構化陣列 (BOOK_DTYPE)，位置先填 0、間隙填 nan。
+
+    Args:
+        book_dimensions: (N, 3) 的陣列或 list of (長L, 寬W, 高H)。
+
+    Returns:
+        np.ndarray: 長度 N 的結構化陣列。
+    """
+    dims = np.asarray(book_dimensions, dtype=float).reshape(-1, 3)
+    books = np.zeros(len(dims), dtype=BOOK_DTYPE)
+    books['L'], books['W'], books['H'] = dims[:, 0], dims[:, 1], dims[:, 2]
+    books['gap'] = np.nan
+    return books
+
+
+def pack_row(books, gap=0.02, random_gaps=False, gap_min=0.01, gap_max=0.05, rng=None):
+    """
+    沿 X 軸一次排好所有書本（向量化，不建立任何幾何物件）。
+
+    Args:
+        books: make_books 產生的結構化陣列，會直接寫入 x, y, z, shelf, gap 欄位。
+        gap (float): 固定間隙（當 random_gaps=False 時使用）。
+        random_gaps (bool): 若 True 則每本書之間的間隙以隨機值取代。
+        gap_min, gap_max (float): 隨機間隙的範圍。
+        rng: np.random.Generator，未指定時自動建立。
+
+    Returns:
+        np.ndarray: 同一個 books 陣列（最後一本之後的間隙為 nan）。
+    """
+    n = len(books)
+    if n == 0:
+        return books
+    if random_gaps:
+        rng = rng if rng is not None else np.random.default_rng()
+        lo, hi = (gap_min, gap_max) if gap_min <= gap_max else (gap_max, gap_min)
+        gaps = rng.uniform(lo, hi, size=n - 1)
+    else:
+        gaps = np.full(n - 1, float(gap))
+
+    # 每本書的起點 = 前面所有書長 + 間隙的累加
+    starts = np.zeros(n)
+    np.cumsum(books['L'][:-1] + gaps, out=starts[1:])
+    books['x'] = starts + books['L'] / 2
+    books['y'] = books['W'] / 2
+    books['z'] = books['H'] / 2
+    books['shelf'] = 0
+    books['gap'][:-1] = gaps
+    books['gap'][-1] = np.nan
+    return books
+
+
+def make_shelves(count, length, height, depth, board=0.02):
+    """
+    建立 count 層相同尺寸、由下往上疊放的層板（層板厚度 board）。
+
+    Returns:
+        np.ndarray: 長度 count 的結構化陣列 (SHELF_DTYPE)。
+    """
+    shelves = np.zeros(count, dtype=SHELF_DTYPE)
+    shelves['length'], shelves['height'], shelves['depth'] = length, height, depth
+    shelves['z'] = np.arange(count) * (height + board)
+    return shelves
+
+
+def pack_shelves(books, shelves, min_gap=0.005, headroom=0.03, finger_gap=0.02):
+    """
+    將書本裝進多層有長、高、深限制的層板（best-fit decreasing 的層板式 skyline）。
+
+    書本依高度由高到低排序，每本放進「放得下且剩餘長度最少」的層板；
+    同尺寸的層板以排序好的剩餘長度清單 + 二分搜尋挑選，整體約 O(n log n)。
+    書本直立、書脊朝外，不旋轉也不堆疊。預設的 min_gap 小於 finger_gap：
+    書排得比較密，夾在中間又太高的書就抽不出來。min_gap 調到 finger_gap
+    會裝得比較少，但每本書都至少有一側可以伸手指進去。
+
+    report 的 accessibility 是每層板上「能抽出」的書本比例：書頂與上層板之間
+    至少有 headroom，或左右任一側（最後一本的右側是層板的剩餘長度）的間隙至少
+    有 finger_gap。空層板記為 1。
+
+    Args:
+        books: make_books 產生的結構化陣列，會直接寫入 x, y, z, shelf, gap 欄位；
+               放不下的書 shelf = -1、位置為 nan。
+        shelves: make_shelves 產生的層板陣列（尺寸可不同）。
+        min_gap (float): 相鄰書本之間保留的最小間隙（預設小於 finger_gap）。
+        headroom (float): 書頂與上層板之間至少要有的空間，才算能抽出。
+        finger_gap (float): 左右任一側的間隙至少要有多寬，才算能抽出。
+
+    Returns:
+        tuple: (books, report)，report 為每層板一筆的 SHELF_REPORT_DTYPE 陣列。
+    """
+    n = len(books)
+    shelf_of = np.full(n, -1)
+    seq = np.full(n, -1)  # 在層板上的擺放順序
+
+    # 同 (高, 深) 的層板歸為一組，各自維護排序好的 (剩餘長度, 層板編號)
+    classes = {}
+    for i, sh in enumerate(shelves):
+        classes.setdefault((sh['height'], sh['depth']), []).append((float(sh['length']), i))
+    for free in classes.values():
+        free.sort()
+
+    Ls, Ws, Hs = books['L'].tolist(), books['W'].tolist(), books['H'].tolist()
+    order = np.lexsort((-books['L'], -books['H']))  # 先高後矮，同高度先厚後薄
+    for k, b in enumerate(order.tolist()):
+        L, W, H = Ls[b], Ws[b], Hs[b]
+        best_free, best_j = None, -1
+        for (height, depth), free in classes.items():
+            if height < H or depth < W:
+                continue
+            j = bisect_left(free, (L,))  # 剩餘長度 >= L 中最小的一層
+            if j < len(free) and (best_free is None or free[j][0] < best_free[best_j][0]):
+                best_free, best_j = free, j
+        if best_free is None:
+            continue
+        rem, i = best_free.pop(best_j)
+        insort(best_free, (rem - L - min_gap, i))
+        shelf_of[b] = i
+        seq[b] = k
+
+    placed = shelf_of >= 0
+    books['shelf'] = shelf_of
+    for f in ('x', 'y', 'z', 'gap'):
+        books[f] = np.nan
+    report = np.zeros(len(shelves), dtype=SHELF_REPORT_DTYPE)
+    if not placed.any():
+        # 沒有任何書放得下（或沒有書）：所有層板都是空的
+        report['accessibility'] = 1.0
+        return books, report
+
+    # 每層板由左到右：依 (層板, 擺放順序) 排好後，以分組累加求 x
+    idx = np.flatnonzero(placed)
+    idx = idx[np.lexsort((seq[idx], shelf_of[idx]))]
+    step = books['L'][idx] + min_gap
+    ends = np.cumsum(step)
+    first = np.r_[True, shelf_of[idx][1:] != shelf_of[idx][:-1]]
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(idx)), 0))
+    starts = ends - step - (ends - step)[group_start]
+    books['x'][idx] = starts + books['L'][idx] / 2
+    books['y'][idx] = books['W'][idx] / 2
+    books['z'][idx] = shelves['z'][shelf_of[idx]] + books['H'][idx] / 2
+    last = np.r_[~first[1:], False]  # 同層板的下一本是否存在
+    books['gap'][idx[last]] = min_gap
+
+    # 每層板的統計
+    s = shelf_of[placed]
+    report['count'] = np.bincount(s, minlength=len(shelves))
+    report['used'] = np.bincount(s, weights=books['L'][placed] + min_gap, minlength=len(shelves))
+    report['used'] -= np.where(report['count'] > 0, min_gap, 0)
+    report['linear_fill'] = report['used'] / shelves['length']
+    volume = books['L'] * books['W'] * books['H']
+    report['fill_ratio'] = np.bincount(s, weights=volume[placed], minlength=len(shelves)) \
+        / (shelves['length'] * shelves['height'] * shelves['depth'])
+    # 能抽出：書頂有足夠空間，或左右任一側的間隙夠寬
+    # （左側：第一本緊貼層板側邊；右側：最後一本旁是層板尾端的剩餘長度）
+    slack = shelves['length'] - report['used']
+    left = np.where(first, 0.0, min_gap)
+    right = np.where(last, min_gap, slack[shelf_of[idx]])
+    reachable = (shelves['height'][shelf_of[idx]] - books['H'][idx] >= headroom) \
+        | (np.maximum(left, right) >= finger_gap)
+    ok = np.bincount(shelf_of[idx], weights=reachable, minlength=len(shelves))
+    report['accessibility'] = np.divide(ok, report['count'], out=np.ones(len(shelves)),
+                                        where=report['count'] > 0)
+    return books, report
+
+
+def to_box(book):
+    """將單筆書本紀錄轉成 compas 的 cg.Box（中心點位於 x, y, z）。"""
+    import compas.geometry as cg
+    frame = cg.Frame([float(book['x']), float(book['y']), float(book['z'])], [1, 0, 0], [0, 1, 0])
+    return cg.Box(float(book['L']), float(book['W']), float(book['H']), frame=frame)
+
+
+def iter_boxes(books, indices=None):
+    """
+    只為需要檢視或輸出的書本建立 cg.Box（逐一產生，不會一次建立全部）。
+
+    Args:
+        books: 已排列好的結構化陣列。
+        indices: 要建立的書本索引（None 表示全部）。
+    """
+    if indices is None:
+        indices = range(len(books))
+    for i in indices:
+        yield to_box(books[i])
+
+
+def save_csv(books, path):
+    """將所有書本的尺寸、位置與層板編號輸出成 CSV。"""
+    np.savetxt(path,
+               np.column_stack([np.arange(len(books))] + [books[f] for f in BOOK_DTYPE.names]),
+               fmt=['%d', '%.4f', '%.4f', '%.4f', '%.4f', '%.4f', '%.4f', '%d', '%.4f'],
+               delimiter=',', header='id,' + ','.join(BOOK_DTYPE.names), comments='')
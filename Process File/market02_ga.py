@@ -0,0 +1,216 @@
+# Market02 的基因演算法模式：整個族群以 NumPy 陣列儲存與評分
+# 個體 = 每個攤位的左上角 (x, y)，族群陣列形狀為 (P, N, 2)
+# 所有隨機放置（初始族群、重置突變、重疊修復）都從空場地的合法左上角抽樣，
+# 只重抽真的重疊的攤位；少數抽不出來的個體才改用 FeasibleAnchors 逐一放置
+import time
+
+import numpy as np
+
+import Market02 as m
+from marketlib.feasibility import FeasibleAnchors, anchor_mask
+
+
+def stall_arrays(table=m.ADJ_SCORES):
+    """
+    由 Market02.make_layout 取出每個攤位的尺寸、排水需求與鄰接分數矩陣。
+
+    尺寸的分配方式與 try_place 相同：依 sizes 的插入順序逐一取用。
+    """
+    layout = m.make_layout()
+    return layout.w, layout.h, (layout.drain_need > 0).astype(float), m.pair_scores(layout, table)
+
+
+def overlaps(pos, w, h):
+    """(P, N, N) 布林陣列：攤位 i 與 j 是否重疊（對角線為 False）。"""
+    x, y = pos[..., 0], pos[..., 1]
+    ox = (x[:, :, None] < x[:, None, :] + w[None, None, :]) & (x[:, None, :] < x[:, :, None] + w[None, :, None])
+    oy = (y[:, :, None] < y[:, None, :] + h[None, None, :]) & (y[:, None, :] < y[:, :, None] + h[None, :, None])
+    hit = ox & oy
+    hit[:, np.arange(len(w)), np.arange(len(w))] = False
+    return hit
+
+
+def place_movers(ind, w, h, movers, rng):
+    """
+    把一個個體 (N, 2) 中 movers 標記的攤位，重新放到避開其他攤位的合法左上角。
+
+    由大到小依序從 FeasibleAnchors 抽樣並更新遮罩；某個攤位已無合法位置時回傳 False。
+    """
+    blocked = np.zeros((m.grid_h, m.grid_w), dtype=bool)
+    for i in np.flatnonzero(~movers).tolist():
+        x, y = ind[i]
+        blocked[y:y + h[i], x:x + w[i]] = True
+    todo = np.flatnonzero(movers)
+    todo = todo[np.argsort(-(w[todo] * h[todo]), kind="stable")].tolist()
+    # grid 是 [y][x]，所以遮罩的尺寸順序為 (h, w)
+    anchors = FeasibleAnchors(blocked, [(h[i], w[i]) for i in todo])
+    randrange = lambda n: int(rng.integers(n))
+    for i in todo:
+        spot = anchors.sample((h[i], w[i]), randrange)
+        if spot is None:
+            return False
+        anchors.place(*spot, (h[i], w[i]))
+        ind[i] = spot[1], spot[0]
+    return True
+
+
+def shared_anchors(w, h):
+    """
+    所有攤位共用的合法左上角表：回傳 (xy, start, count)。
+
+    xy 為 (K, 2) 的 (x, y)，攤位 i 的合法位置是 xy[start[i]:start[i] + count[i]]；
+    同尺寸的攤位共用同一段。
+    """
+    free = np.zeros((m.grid_h, m.grid_w), dtype=bool)
+    sizes = list(dict.fromkeys(zip(w.tolist(), h.tolist())))
+    blocks, offset = {}, 0
+    for sw, sh in sizes:
+        # grid 是 [y][x]，所以遮罩的尺寸順序為 (h, w)
+        ys, xs = np.nonzero(anchor_mask(free, (sh, sw)))
+        blocks[sw, sh] = (offset, np.stack([xs, ys], axis=1))
+        offset += len(xs)
+    xy = np.concatenate([blocks[s][1] for s in sizes])
+    start = np.array([blocks[s][0] for s in zip(w.tolist(), h.tolist())])
+    count = np.array([len(blocks[s][1]) for s in zip(w.tolist(), h.tolist())])
+    return xy, start, count
+
+
+def resample(pos, w, h, anchors, bad, rng, tries=16):
+    """
+    把 bad (P, N) 標記的攤位一次全部改抽 anchors（shared_anchors 的結果）中的合法左上角。
+
+    每個攤位抽 tries 個候選位置，取第一個不壓到同一個體其他攤位（以目前位置計）的候選；
+    都不行就用第一個，留給下一輪修復。
+    """
+    xy, start, count = anchors
+    p, i = np.nonzero(bad)
+    cand = xy[start[i, None] + (rng.random((len(i), tries)) * count[i, None]).astype(int)]  # (M, C, 2)
+    if tries > 1:
+        other = pos[p][:, None]  # (M, 1, N, 2)
+        cx, cy = cand[..., 0, None], cand[..., 1, None]
+        hit = ((cx < other[..., 0] + w) & (other[..., 0] < cx + w[i, None, None])
+               & (cy < other[..., 1] + h) & (other[..., 1] < cy + h[i, None, None]))  # (M, C, N)
+        hit[np.arange(len(i)), :, i] = False  # 不跟自己比
+        pick = (~hit.any(axis=2)).argmax(axis=1)
+    else:
+        pick = np.zeros(len(i), dtype=int)
+    pos[p, i] = cand[np.arange(len(i)), pick]
+    return pos
+
+
+def random_positions(rng, count, w, h, anchors=None):
+    """整批抽樣 count 組 (P, N, 2) 的左上角座標再修復重疊，回傳 (pos, 每個個體是否合法)。"""
+    anchors = shared_anchors(w, h) if anchors is None else anchors
+    pos = resample(np.zeros((count, len(w), 2), dtype=int), w, h, anchors,
+                   np.ones((count, len(w)), dtype=bool), rng, tries=1)
+    return repair(pos, w, h, rng, anchors=anchors)
+
+
+def repair(pos, w, h, rng, movers=None, anchors=None, rounds=10, tries=10):
+    """
+    重疊修復：movers 指定的攤位先重抽一次，之後每輪只把「壓到編號較小攤位」的攤位
+    從共用的合法左上角表重抽，其餘攤位不動。rounds 輪後仍有重疊的個體（很少見）
+    才用 place_movers 逐一放置，再不行就整個個體重新放置。
+    回傳 (pos, 每個個體是否合法)。
+    """
+    anchors = shared_anchors(w, h) if anchors is None else anchors
+    if movers is not None:
+        resample(pos, w, h, anchors, movers, rng)
+    later = np.triu(np.ones((len(w), len(w)), dtype=bool))
+    todo = np.arange(len(pos))
+    for _ in range(rounds):
+        bad = (overlaps(pos[todo], w, h) & later).any(axis=1)  # (k, N)：j 壓到較早的 i
+        keep = bad.any(axis=1)
+        todo, bad = todo[keep], bad[keep]
+        if not len(todo):
+            break
+        pos[todo] = resample(pos[todo], w, h, anchors, bad, rng)
+    valid = np.ones(len(pos), dtype=bool)
+    if len(todo):
+        bad = (overlaps(pos[todo], w, h) & later).any(axis=1)
+        everything = np.ones(len(w), dtype=bool)
+        for p, movers_p in zip(todo.tolist(), bad):
+            ok = not movers_p.any() or place_movers(pos[p], w, h, movers_p, rng)
+            for _ in range(tries):
+                if ok:
+                    break
+                ok = place_movers(pos[p], w, h, everything, rng)
+            valid[p] = ok
+    return pos, valid
+
+
+def fitness(pos, w, h, drain, adj, valid=None):
+    """一次評分整個族群，與 Market02.score 共用 score_centers（越低越好）。"""
+    s = m.score_centers(pos[..., 0] + w / 2, pos[..., 1] + h / 2, drain, adj)
+    if valid is not None:
+        s = np.where(valid, s, 1e6)  # 仍有重疊的個體視為不合法
+    return s
+
+
+def evolve(population=100, generations=200, time_budget=None, elite=4, mutation=0.1,
+           table=m.ADJ_SCORES, seed=None, callback=None):
+    """
+    以基因演算法搜尋 Market02 的攤位配置。
+
+    Args:
+        population (int): 族群大小。
+        generations (int): 最多演化代數。
+        time_budget (float): 秒數上限（None 表示只看代數）。
+        elite (int): 每代直接保留的最佳個體數。
+        mutation (float): 每個攤位被突變的機率。
+        table (dict): 鄰接分數表（同 Market02.ADJ_SCORES）。
+        callback: 每代結束時呼叫 callback(代數, pos, scores)，例如用來輸出目前最佳配置。
+
+    Returns:
+        tuple: (pos, scores, history)，pos 為最後一代依分數排序的 (P, N, 2) 陣列，
+               history 為每代最佳分數。
+    """
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    w, h, drain, adj = stall_arrays(table)
+    anchors = shared_anchors(w, h)
+
+    pos, valid = random_positions(rng, population, w, h, anchors)
+    scores = fitness(pos, w, h, drain, adj, valid)
+    history = [scores.min()]
+    if callback is not None:
+        callback(0, pos, scores)
+    for gen in range(1, generations + 1):
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            break
+        order = np.argsort(scores)
+        pos, scores = pos[order], scores[order]
+
+        # 錦標賽選擇：兩兩比較，分數低者成為親代
+        n_child = population - elite
+        a = rng.integers(population, size=(2, n_child))
+        b = rng.integers(population, size=(2, n_child))
+        parents = np.where(scores[a] <= scores[b], a, b)
+
+        # 均勻交配：每個攤位的位置隨機取自父或母
+        take = rng.random((n_child, len(w))) < 0.5
+        child = np.where(take[..., None], pos[parents[0]], pos[parents[1]])
+
+        # 突變：一半小幅平移，一半在修復時從合法左上角重新放置
+        mut = rng.random((n_child, len(w))) < mutation
+        shift = rng.integers(-2, 3, size=child.shape)
+        jump = rng.random((n_child, len(w))) < 0.5
+        child = np.where((mut & ~jump)[..., None], child + shift, child)
+        child[..., 0] = np.clip(child[..., 0], 0, m.grid_w - w)
+        child[..., 1] = np.clip(child[..., 1], 0, m.grid_h - h)
+
+        child, valid = repair(child, w, h, rng, movers=mut & jump, anchors=anchors)
+        pos = np.concatenate([pos[:elite], child])
+        scores = np.concatenate([scores[:elite], fitness(child, w, h, drain, adj, valid)])
+        history.append(scores.min())
+        if callback is not None:
+            callback(gen, pos, scores)
+
+    order = np.argsort(scores)
+    return pos[order], scores[order], history
+
+
+def to_layout(individual):
+    """將一個個體轉成 Market02.try_place 的 (layout, grid) 格式，供原本的輸出流程使用。"""
+    layout = m.make_layout().moved(individual[:, 0], individual[:, 1])
+    return layout, layout.rasterize(m.grid_w, m.grid_h)
@@ -0,0 +1,7 @@
+"""Modules shared by the market generators in 'Final Project File' and 'Process File'.
+
+- ``market_core``: StallType and the struct-of-arrays Layout
+- ``feasibility``: legal-anchor masks from a summed-area table
+- ``crowd_flow``: vectorized shopper-flow simulation
+- ``async_writer``: background writer for exports
+"""
@@ -0,0 +1,113 @@
+"""Background output pipeline so exports never block layout computation.
+
+Export jobs (PNG encoding, CSV/TXT writes) are queued on a bounded queue
+and drained by writer threads while the caller computes the next layout.
+Pillow/zlib encoding and file I/O release the GIL, so threads are enough to
+overlap them with NumPy work.  Matplotlib is not thread-safe and its
+rendering holds the GIL: draw figures on the calling thread and queue only
+the pixels with ``write_png`` (see ``render_figure``).
+
+``submit`` blocks once ``max_pending`` jobs are waiting (backpressure keeps
+memory bounded when the writer falls behind), ``flush`` waits for the queue
+to drain and ``close`` flushes and stops the threads; it is also registered
+with ``atexit`` so nothing is lost when a script ends early.
+
+Usage::
+
+    with AsyncWriter() as writer:
+        writer.write_png('outputs/map.png', rgb_array)
+        writer.write_png('outputs/plot.png', render_figure(fig))
+        writer.write_text('outputs/report.txt', text)
+"""
+import atexit
+import queue
+import threading
+
+import numpy as np
+
+_STOP = object()
+
+
+class AsyncWriter:
+    def __init__(self, max_pending=8, workers=1):
+        self.max_pending = max_pending
+        self.errors = []  # (job description, exception) for every failed job
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, name=f'async-writer-{i}', daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                fn, args, kwargs = job
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    self.errors.append((f'{getattr(fn, "__name__", fn)}{args[:1]}', e))
+            finally:
+                self._queue.task_done()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)``; blocks while ``max_pending`` jobs are waiting.
+
+        Arguments must not be mutated after submitting (pass copies).
+        """
+        if self._closed:
+            raise RuntimeError('AsyncWriter is closed')
+        self._queue.put((fn, args, kwargs))
+
+    def write_text(self, path, text, encoding='utf-8'):
+        """Queue writing ``text`` to ``path``."""
+        self.submit(_write_text, path, text, encoding)
+
+    def write_png(self, path, pixels):
+        """Queue encoding a uint8 (H, W, 3|4) array as PNG and writing it to ``path``."""
+        self.submit(_write_png, path, pixels)
+
+    def flush(self):
+        """Block until every queued job has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Flush pending jobs and stop the writer threads (safe to call twice)."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def render_figure(fig):
+    """Draw a matplotlib figure on the calling thread and return a copy of its RGBA pixels."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def _write_text(path, text, encoding):
+    with open(path, 'w', encoding=encoding) as f:
+        f.write(text)
+
+
+def _write_png(path, pixels):
+    from PIL import Image
+    Image.fromarray(pixels).save(path)
@@ -0,0 +1,253 @@
+"""Vectorized shopper-flow simulation used to score layouts by footfall.
+
+Shoppers walk on the walkable cells of a layout (aisles and empty floor) from
+an entrance to stalls of their target types and then out through the nearest
+entrance.  Every route is driven by a precomputed flow field: one
+breadth-first distance map per stall type plus one for the exits, turned into
+a "next cell" lookup table.  All shoppers are advanced together with NumPy, so
+a full market day with thousands of shoppers runs in well under a second on a
+40x25 grid.
+
+All arrays are indexed ``[y, x]`` like ``Grid.cells`` in ``final project.py``;
+points (entrances) are ``(x, y)`` tuples.
+"""
+import numpy as np
+
+# (dx, dy) offsets, same 8-neighbourhood and order as Grid.neighbors
+NEIGHBOR_OFFSETS = [(-1, -1), (-1, 0), (-1, 1),
+                    (0, -1),           (0, 1),
+                    (1, -1),  (1, 0),  (1, 1)]
+
+
+def _shift(arr, dx, dy, fill):
+    """Return a copy where out[y, x] = arr[y+dy, x+dx] (``fill`` outside the grid)."""
+    out = np.full_like(arr, fill)
+    h, w = arr.shape
+    out[max(0, -dy):min(h, h - dy), max(0, -dx):min(w, w - dx)] = \
+        arr[max(0, dy):min(h, h + dy), max(0, dx):min(w, w + dx)]
+    return out
+
+
+def dilate(mask):
+    """Grow a boolean mask by one cell in all 8 directions."""
+    grown = mask.copy()
+    for dx, dy in NEIGHBOR_OFFSETS:
+        grown |= _shift(mask, dx, dy, False)
+    return grown
+
+
+def distance_field(walkable, sources):
+    """Step distance (8-connected) from ``sources`` over walkable cells; np.inf if unreachable."""
+    dist = np.full(walkable.shape, np.inf)
+    frontier = sources & walkable
+    reached = frontier.copy()
+    d = 0
+    while frontier.any():
+        dist[frontier] = d
+        frontier = dilate(frontier) & walkable & ~reached
+        reached |= frontier
+        d += 1
+    return dist
+
+
+def descent_table(dist):
+    """Flat index of the neighbour with the lowest distance for every cell (self at sources)."""
+    h, w = dist.shape
+    flat = np.arange(h * w).reshape(h, w)
+    cand_dist = np.stack([dist] + [_shift(dist, dx, dy, np.inf) for dx, dy in NEIGHBOR_OFFSETS])
+    cand_idx = np.stack([flat] + [_shift(flat, dx, dy, -1) for dx, dy in NEIGHBOR_OFFSETS])
+    best = np.argmin(cand_dist, axis=0)
+    return np.take_along_axis(cand_idx, best[None], axis=0)[0].ravel()
+
+
+def build_flow_fields(walkable, stall_ids, stall_types, entrances):
+    """Precompute the flow fields for one layout.
+
+    Args:
+        walkable: bool array (H, W), True where shoppers may walk.
+        stall_ids: int array (H, W), stall instance id per cell or -1.
+        stall_types: sequence mapping stall id -> stall type index.
+        entrances: list of (x, y) entrance/exit cells (must be walkable).
+
+    Returns:
+        dict of arrays consumed by ``simulate``.
+    """
+    walkable = np.asarray(walkable, dtype=bool)
+    stall_ids = np.asarray(stall_ids, dtype=int)
+    stall_types = np.asarray(stall_types, dtype=int)
+    h, w = walkable.shape
+    n_stalls = len(stall_types)
+    n_types = int(stall_types.max()) + 1 if n_stalls else 0
+
+    type_map = np.where(stall_ids >= 0, stall_types[np.maximum(stall_ids, 0)], -1) if n_stalls \
+        else np.full((h, w), -1)
+
+    entrance_mask = np.zeros((h, w), dtype=bool)
+    entrance_idx = []
+    for x, y in entrances:
+        if 0 <= x < w and 0 <= y < h and walkable[y, x]:
+            entrance_mask[y, x] = True
+            entrance_idx.append(y * w + x)
+
+    # row t: walk toward stall type t, last row: walk toward the nearest exit
+    dists = np.full((n_types + 1, h * w), np.inf)
+    tables = np.empty((n_types + 1, h * w), dtype=int)
+    # stall id a shopper reaches when standing on the storefront cell of type t
+    front_stall = np.full((n_types, h * w), -1)
+    for t in range(n_types):
+        fronts = walkable & dilate(type_map == t)
+        dist = distance_field(walkable, fronts)
+        dists[t] = dist.ravel()
+        tables[t] = descent_table(dist)
+        owner = np.full((h, w), -1)
+        # reversed so the first neighbour in NEIGHBOR_OFFSETS order wins
+        for dx, dy in reversed(NEIGHBOR_OFFSETS):
+            nb_type = _shift(type_map, dx, dy, -1)
+            nb_id = _shift(stall_ids, dx, dy, -1)
+            owner = np.where(fronts & (nb_type == t), nb_id, owner)
+        front_stall[t] = owner.ravel()
+    exit_dist = distance_field(walkable, entrance_mask)
+    dists[n_types] = exit_dist.ravel()
+    tables[n_types] = descent_table(exit_dist)
+
+    # walkable neighbour of every cell per offset (-1 if blocked), used for browsing steps
+    flat = np.arange(h * w).reshape(h, w)
+    neighbors = np.stack([np.where(_shift(walkable, dx, dy, False), _shift(flat, dx, dy, -1), -1).ravel()
+                          for dx, dy in NEIGHBOR_OFFSETS])
+
+    # (cell, stall) pairs for every walkable cell that fronts a stall, used for exposure
+    cells, stalls = [], []
+    for dx, dy in NEIGHBOR_OFFSETS:
+        nb_id = _shift(stall_ids, dx, dy, -1)
+        sel = walkable & (nb_id >= 0)
+        cells.append(flat[sel])
+        stalls.append(nb_id[sel])
+    pairs = np.unique(np.concatenate(cells) * max(n_stalls, 1) + np.concatenate(stalls)) \
+        if n_stalls else np.empty(0, dtype=int)
+
+    return {
+        'shape': (h, w),
+        'walkable': walkable,
+        'entrances': np.array(entrance_idx, dtype=int),
+        'n_types': n_types,
+        'n_stalls': n_stalls,
+        'dists': dists,
+        'tables': tables,
+        'neighbors': neighbors,
+        'front_stall': front_stall,
+        'exposure_cells': pairs // max(n_stalls, 1),
+        'exposure_stalls': pairs % max(n_stalls, 1),
+    }
+
+
+def simulate(fields, n_shoppers=5000, duration=600, n_stops=3, type_weights=None,
+             wander=0.3, capacity=4, leak=0.2, seed=None):
+    """Run a market day: ``n_shoppers`` arrive uniformly over ``duration`` steps.
+
+    Each shopper visits ``n_stops`` stall types drawn from ``type_weights``
+    in turn, then leaves; types with no storefront reachable from an entrance
+    get weight 0 (the rest are renormalised).  With probability ``wander`` a step goes to a random
+    walkable neighbour instead of following the flow field (browsing).  A
+    shopper whose next cell already holds ``capacity`` people waits, except
+    with probability ``leak`` (so jams always dissolve).
+
+    Returns:
+        dict with per-stall ``footfall`` (shoppers who bought there),
+        per-stall ``exposure`` (shopper-steps spent in front of the stall),
+        ``heatmap`` (shopper-steps per cell), ``peak`` (max simultaneous
+        occupancy per cell), ``mean_trip_time`` (steps from arrival to exit
+        for served shoppers), ``served`` and ``unserved`` counts.
+    """
+    rng = np.random.default_rng(seed)
+    h, w = fields['shape']
+    n_types = fields['n_types']
+    n_stalls = fields['n_stalls']
+    entrances = fields['entrances']
+    dists = fields['dists']
+    tables = fields['tables']
+    neighbors = fields['neighbors']
+    front_stall = fields['front_stall']
+    exit_row = n_types
+
+    footfall = np.zeros(n_stalls, dtype=int)
+    heat = np.zeros(h * w)
+    peak = np.zeros(h * w, dtype=int)
+    if type_weights is None:
+        type_weights = np.ones(n_types)
+    p = np.asarray(type_weights, dtype=float)
+    # types without a storefront reachable from any entrance (e.g. no stall of that type
+    # was placed) are dropped from the shopping lists instead of stranding their shoppers
+    if n_types and len(entrances):
+        p = np.where(np.isfinite(dists[:n_types, entrances]).any(axis=1), p, 0.0)
+    if n_types == 0 or len(entrances) == 0 or n_shoppers <= 0 or p.sum() <= 0:
+        return {'footfall': footfall, 'exposure': np.zeros(n_stalls), 'heatmap': heat.reshape(h, w),
+                'peak': peak.reshape(h, w), 'mean_trip_time': float('nan'),
+                'served': 0, 'unserved': int(max(n_shoppers, 0))}
+    p = p / p.sum()
+
+    pos = entrances[rng.integers(len(entrances), size=n_shoppers)]
+    # shopping list per shopper, the exit row closes every list
+    plan = np.column_stack([rng.choice(n_types, size=(n_shoppers, n_stops), p=p),
+                            np.full(n_shoppers, exit_row)])
+    stop = np.zeros(n_shoppers, dtype=int)
+    leg = plan[:, 0].copy()
+    spawn = np.sort(rng.integers(0, duration, size=n_shoppers))
+    # shoppers with an unreachable stall type on their list never enter the simulation
+    reachable = np.isfinite(dists[plan, pos[:, None]]).all(axis=1)
+    done = ~reachable
+    finish = np.full(n_shoppers, -1)
+
+    max_steps = duration + 4 * (h + w) * (n_stops + 1)
+    t = 0
+    for t in range(max_steps):
+        idx = np.flatnonzero((spawn <= t) & ~done)
+        if idx.size == 0:
+            if t >= spawn[-1]:
+                break
+            continue
+        here = pos[idx]
+        cur = leg[idx]
+        at_goal = dists[cur, here] == 0
+
+        # arrived at the target stall: record the purchase and move on to the next stop
+        shop = at_goal & (cur != exit_row)
+        if shop.any():
+            bought = front_stall[cur[shop], here[shop]]
+            footfall += np.bincount(bought[bought >= 0], minlength=n_stalls)
+            shoppers = idx[shop]
+            stop[shoppers] += 1
+            leg[shoppers] = plan[shoppers, stop[shoppers]]
+        # arrived at an exit: leave the market
+        gone = at_goal & (cur == exit_row)
+        done[idx[gone]] = True
+        finish[idx[gone]] = t
+
+        movers = idx[~at_goal]
+        occ = np.bincount(here, minlength=h * w)
+        nxt = tables[leg[movers], pos[movers]]
+        browse = rng.random(movers.size) < wander
+        if browse.any():
+            step = neighbors[rng.integers(len(NEIGHBOR_OFFSETS), size=browse.sum()), pos[movers[browse]]]
+            nxt[browse] = np.where(step >= 0, step, nxt[browse])
+        free = (occ[nxt] < capacity) | (rng.random(movers.size) < leak)
+        pos[movers[free]] = nxt[free]
+
+        still = idx[~gone]
+        occ = np.bincount(pos[still], minlength=h * w)
+        heat += occ
+        np.maximum(peak, occ, out=peak)
+
+    served = finish >= 0
+    trips = finish[served] - spawn[served]
+    exposure = np.bincount(fields['exposure_stalls'], weights=heat[fields['exposure_cells']],
+                           minlength=n_stalls)
+    return {
+        'footfall': footfall,
+        'exposure': exposure,
+        'heatmap': heat.reshape(h, w),
+        'peak': peak.reshape(h, w),
+        'mean_trip_time': float(trips.mean()) if trips.size else float('nan'),
+        'served': int(served.sum()),
+        'unserved': int(n_shoppers - served.sum()),
+        'steps': t + 1,
+    }
@@ -0,0 +1,65 @@
+import numpy as np
+
+
+def anchor_mask(blocked, size):
+    """Boolean mask of every legal top-left anchor for a footprint.
+
+    mask[i, j] is True when blocked[i:i+size[0], j:j+size[1]] lies inside the
+    grid and contains no blocked cell.  `size` is given in the array's own axis
+    order (Market01 grids are [x, y] with size (w, h), Market02 grids are
+    [y][x] so the footprint is (h, w)).  Uses one summed-area table, so the
+    cost is O(cells) regardless of the footprint.
+    """
+    return _window_free(_summed_area(blocked), blocked.shape, size)
+
+
+def _summed_area(blocked):
+    sat = np.zeros((blocked.shape[0] + 1, blocked.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(blocked, axis=0), axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def _window_free(sat, shape, size):
+    a, b = size
+    mask = np.zeros(shape, dtype=bool)
+    if a > shape[0] or b > shape[1]:
+        return mask
+    window = sat[a:, b:] - sat[:-a, b:] - sat[a:, :-b] + sat[:-a, :-b]
+    mask[:shape[0] - a + 1, :shape[1] - b + 1] = window == 0
+    return mask
+
+
+class FeasibleAnchors:
+    """Legal anchors for every footprint, kept up to date as stalls are placed.
+
+    All masks are built from a single summed-area table of the initial
+    `blocked` grid (e.g. main paths).  Placing a stall can only remove anchors,
+    so `place` just clears the window of anchors whose footprint would now
+    overlap it -- no recomputation.
+    """
+
+    def __init__(self, blocked, sizes):
+        self.blocked = np.array(blocked, dtype=bool)
+        sat = _summed_area(self.blocked)
+        self.masks = {tuple(s): _window_free(sat, self.blocked.shape, tuple(s)) for s in set(map(tuple, sizes))}
+
+    def place(self, i, j, size):
+        """Mark the footprint at anchor (i, j) as occupied and update every mask."""
+        a, b = size
+        self.blocked[i:i+a, j:j+b] = True
+        for (fa, fb), mask in self.masks.items():
+            mask[max(0, i - fa + 1):i + a, max(0, j - fb + 1):j + b] = False
+
+    def count(self, size):
+        return int(self.masks[tuple(size)].sum())
+
+    def sample(self, size, randrange):
+        """Random legal anchor (i, j) for `size`, or None if there is none.
+
+        `randrange` is e.g. random.randrange, so callers keep their own RNG.
+        """
+        legal = np.flatnonzero(self.masks[tuple(size)])
+        if legal.size == 0:
+            return None
+        i, j = np.unravel_index(legal[randrange(legal.size)], self.blocked.shape)
+        return int(i), int(j)
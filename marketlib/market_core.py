@@ -0,0 +1,108 @@
+"""Shared stall / layout data model for every market generator.
+
+``StallType`` describes a kind of stall (odor, wetness, drain need, allowed
+footprints).  ``Layout`` is a struct-of-arrays: one NumPy column per stall
+attribute, all views into a single contiguous int32 block, so scoring code
+indexes flat arrays instead of dicts/attributes and a layout pickles as one
+buffer when it crosses a process boundary.
+"""
+import numpy as np
+
+
+class StallType:
+    __slots__ = ('name', 'odor', 'wetness', 'affinity', 'sizes', 'drain_need')
+
+    def __init__(self, name, odor=0, wetness=0, affinity="both", sizes=None, drain_need=0):
+        self.name = name
+        self.odor = odor
+        self.wetness = wetness
+        self.affinity = affinity  # long-term vs short-term
+        # sizes: list of (w,h) options for the stall footprint in grid cells
+        # if None, default to single-cell
+        self.sizes = sizes or [(1, 1)]
+        self.drain_need = drain_need
+
+    def __repr__(self):
+        return f"StallType({self.name!r})"
+
+
+class Layout:
+    """Stalls as columns: row i is stall i, (x, y) its top-left cell and (w, h) its footprint.
+
+    odor, wetness and drain_need are copied from the stall type when the
+    layout is built.  Columns are views into ``data`` (shape (8, n)), so
+    writing ``layout.x[:] = ...`` updates the block in place.
+    """
+    COLUMNS = ('type_id', 'x', 'y', 'w', 'h', 'odor', 'wetness', 'drain_need')
+    __slots__ = ('types', 'data') + COLUMNS
+
+    def __init__(self, types, type_id, x=None, y=None, w=None, h=None):
+        type_id = np.asarray(type_id, dtype=np.int32)
+        data = np.zeros((len(self.COLUMNS), len(type_id)), dtype=np.int32)
+        data[0] = type_id
+        # default footprint: the first size option of each type
+        first = np.array([t.sizes[0] for t in types], dtype=np.int32).reshape(-1, 2)
+        for row, values in ((1, x), (2, y), (3, w), (4, h)):
+            if values is not None:
+                data[row] = values
+            elif row >= 3:
+                data[row] = first[type_id, row - 3]
+        attrs = np.array([(t.odor, t.wetness, t.drain_need) for t in types], dtype=np.int32).reshape(-1, 3)
+        data[5:] = attrs[type_id].T
+        self._bind(types, data)
+
+    def _bind(self, types, data):
+        self.types = list(types)
+        self.data = data
+        for row, name in enumerate(self.COLUMNS):
+            setattr(self, name, data[row])
+
+    @classmethod
+    def from_block(cls, types, data):
+        """Rebuild a layout from its (8, n) int32 block (no per-stall work)."""
+        layout = cls.__new__(cls)
+        layout._bind(types, np.ascontiguousarray(data, dtype=np.int32))
+        return layout
+
+    @classmethod
+    def from_counts(cls, types, counts):
+        """counts[k] stalls of types[k], in type order, with default footprints at (0, 0)."""
+        return cls(types, np.repeat(np.arange(len(types)), counts))
+
+    @classmethod
+    def from_records(cls, types, records):
+        """Build from (type_id, x, y, w, h) tuples."""
+        rec = np.array(records, dtype=np.int32).reshape(-1, 5)
+        return cls(types, rec[:, 0], rec[:, 1], rec[:, 2], rec[:, 3], rec[:, 4])
+
+    def __reduce__(self):
+        # one contiguous buffer instead of a list of per-stall objects
+        return (Layout.from_block, (self.types, self.data))
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def copy(self):
+        return Layout.from_block(self.types, self.data.copy())
+
+    def moved(self, x, y):
+        """Copy of this layout with new anchor columns."""
+        layout = self.copy()
+        layout.x[:] = x
+        layout.y[:] = y
+        return layout
+
+    @property
+    def names(self):
+        """Type name of every stall as an array of strings."""
+        return np.array([t.name for t in self.types])[self.type_id]
+
+    def centers(self):
+        return self.x + self.w / 2, self.y + self.h / 2
+
+    def rasterize(self, width, height):
+        """Stall index per cell (-1 = free) as a [y, x] array; later stalls overwrite earlier ones."""
+        grid = np.full((height, width), -1, dtype=np.int32)
+        for i, (x, y, w, h) in enumerate(zip(self.x.tolist(), self.y.tolist(), self.w.tolist(), self.h.tolist())):
+            grid[y:y+h, x:x+w] = i
+        return grid